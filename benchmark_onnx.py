@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Accuracy / latency comparison of the PyTorch and ONNX Runtime backends
+for the embedding model and the reranker.
+
+Usage:
+    python benchmark_onnx.py
+    python benchmark_onnx.py --backends onnx onnx-int8 --threads 4
+"""
+
+import time
+import argparse
+import numpy as np
+from semantic_router.samples import productsSample, chitchatSample
+from embeddings import SentenceTransformerEmbedding, EmbeddingConfig, ONNXEmbedding
+from re_rank import Reranker
+
+
+def timed(fn, repeat: int):
+    """Run fn `repeat` times, return (last result, mean latency in ms)."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return result, (time.perf_counter() - start) / repeat * 1000
+
+
+def benchmark_embedding(args, texts):
+    print(f"\n🧠 Embedding model: {args.embedding_model}")
+    reference = SentenceTransformerEmbedding(EmbeddingConfig(name=args.embedding_model))
+    models = {'torch': reference}
+    for backend in args.backends:
+        models[backend] = ONNXEmbedding(
+            name=args.embedding_model, quantize=backend == 'onnx-int8', intra_op_threads=args.threads
+        )
+
+    reference_vectors = reference.encode(texts)
+    reference_vectors = reference_vectors / np.linalg.norm(reference_vectors, axis=1, keepdims=True)
+
+    print(f"{'backend':<12}{'single (ms)':>14}{'batch (ms)':>14}{'cos mean':>12}{'cos min':>12}")
+    for backend, model in models.items():
+        model.encode(texts[0])  # warm-up
+        _, single_ms = timed(lambda: model.encode(texts[0]), args.repeat)
+        vectors, batch_ms = timed(lambda: model.encode(texts), max(args.repeat // 10, 1))
+        vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        cosine = (vectors * reference_vectors).sum(axis=1)
+        print(f"{backend:<12}{single_ms:>14.2f}{batch_ms:>14.2f}{cosine.mean():>12.4f}{cosine.min():>12.4f}")
+
+
+def benchmark_reranker(args, queries, passages):
+    print(f"\n📊 Reranker model: {args.reranker}")
+    models = {'torch': Reranker(model_name=args.reranker, cache_size=0)}
+    for backend in args.backends:
+        models[backend] = Reranker(model_name=args.reranker, cache_size=0, backend=backend)
+
+    reference = [models['torch'].rank(query, passages) for query in queries]
+
+    print(f"{'backend':<12}{'query (ms)':>14}{'top-1 agree':>14}{'max |Δscore|':>14}")
+    for backend, model in models.items():
+        model.rank(queries[0], passages)  # warm-up
+        start = time.perf_counter()
+        rankings = [model.rank(query, passages) for query in queries]
+        query_ms = (time.perf_counter() - start) / len(queries) * 1000
+
+        top1 = np.mean([order[0] == ref_order[0] for (order, _), (ref_order, _) in zip(rankings, reference)])
+        max_diff = max(
+            np.abs(np.sort(scores) - np.sort(ref_scores)).max()
+            for (_, scores), (_, ref_scores) in zip(rankings, reference)
+        )
+        print(f"{backend:<12}{query_ms:>14.2f}{top1:>14.2%}{max_diff:>14.4f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare PyTorch and ONNX Runtime backends")
+    parser.add_argument('--embedding_model', type=str, default='Alibaba-NLP/gte-multilingual-base')
+    parser.add_argument('--reranker', type=str, default='Alibaba-NLP/gte-multilingual-reranker-base')
+    parser.add_argument('--backends', nargs='+', choices=['onnx', 'onnx-int8'], default=['onnx', 'onnx-int8'])
+    parser.add_argument('--threads', type=int, default=None, help='ONNX Runtime intra-op threads')
+    parser.add_argument('--repeat', type=int, default=50, help='Repetitions of the single-text latency test')
+    args = parser.parse_args()
+
+    texts = productsSample + chitchatSample
+    benchmark_embedding(args, texts)
+    benchmark_reranker(args, queries=productsSample[:10], passages=productsSample[10:40])
+
+
+if __name__ == "__main__":
+    main()
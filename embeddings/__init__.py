@@ -1,5 +1,7 @@
 from embeddings.base import BaseEmbedding, APIBaseEmbedding, EmbeddingConfig
 from embeddings.sentenceTransformer import SentenceTransformerEmbedding
+from embeddings.cache import EmbeddingCache, CachedEmbedding
+from embeddings.onnxEmbedding import ONNXEmbedding
 
 # Optional imports for LLM-based embeddings (not required for search-only mode)
 try:
@@ -0,0 +1,212 @@
+import os
+import re
+import json
+import hashlib
+import threading
+import unicodedata
+import contextlib
+import numpy as np
+from typing import List, Union
+from embeddings.base import BaseEmbedding
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: writes are only serialized within one process
+    fcntl = None
+
+KEY_SIZE = 16
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text before hashing so trivially different inputs share a cache entry."""
+    text = unicodedata.normalize('NFC', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+class EmbeddingCache():
+    """
+    Persistent embedding cache for one model.
+
+    Vectors live in a memory-mapped float32 file (`vectors.f32`) and the index is
+    an append-only file of 16-byte keys (`keys.bin`) whose position is the row of
+    the vector. A key is the hash of (model name, normalized text).
+
+    Use `EmbeddingCache.open` so every wrapper in a process shares one instance.
+    Several processes (e.g. an ingestion run next to the server) can write the
+    same directory: `put` holds an exclusive lock on `keys.bin` and first picks
+    up the keys appended by the others, so rows are never handed out twice.
+    """
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, cache_dir: str, model_name: str, initial_capacity: int = 1024):
+        self.model_name = model_name
+        self.path = os.path.join(cache_dir, re.sub(r'[^\w.-]', '_', model_name))
+        self.initial_capacity = initial_capacity
+        self.lock = threading.Lock()
+
+        self._meta_path = os.path.join(self.path, 'meta.json')
+        self._keys_path = os.path.join(self.path, 'keys.bin')
+        self._vectors_path = os.path.join(self.path, 'vectors.f32')
+
+        self.dim = None
+        self._vectors = None
+        self._capacity = 0
+        self._index = {}
+        # Keys of keys.bin already read, the next row to write
+        self._key_count = 0
+
+        os.makedirs(self.path, exist_ok=True)
+        self._load()
+
+    @classmethod
+    def open(cls, cache_dir: str, model_name: str) -> 'EmbeddingCache':
+        """Return the process-wide cache for (cache_dir, model_name)."""
+        key = (os.path.abspath(cache_dir), model_name)
+        with cls._instances_lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls(cache_dir, model_name)
+            return cls._instances[key]
+
+    def __len__(self):
+        return len(self._index)
+
+    def key(self, text: str) -> bytes:
+        payload = f"{self.model_name}\0{normalize_text(text)}".encode('utf-8')
+        return hashlib.blake2b(payload, digest_size=KEY_SIZE).digest()
+
+    def _load(self):
+        if not os.path.exists(self._meta_path):
+            return
+
+        with open(self._meta_path, 'r', encoding='utf-8') as f:
+            self.dim = json.load(f)['dim']
+
+        with open(self._keys_path, 'rb') as f:
+            keys = f.read()
+
+        self._key_count = len(keys) // KEY_SIZE
+        self._index = {keys[i * KEY_SIZE:(i + 1) * KEY_SIZE]: i for i in range(self._key_count)}
+        self._ensure_capacity(self._key_count)
+
+    @contextlib.contextmanager
+    def _locked_keys(self):
+        """keys.bin opened for appending, under an exclusive lock shared by every process."""
+        with open(self._keys_path, 'a+b') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield f
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _refresh(self, keys_file):
+        """Pick up what other processes wrote since the last load, under the keys lock."""
+        if self.dim is None:
+            if not os.path.exists(self._meta_path):
+                return
+            with open(self._meta_path, 'r', encoding='utf-8') as f:
+                self.dim = json.load(f)['dim']
+
+        count, partial = divmod(os.fstat(keys_file.fileno()).st_size, KEY_SIZE)
+        if partial:
+            # A writer died mid-append, drop the incomplete key so rows stay aligned
+            keys_file.truncate(count * KEY_SIZE)
+        if count > self._key_count:
+            keys_file.seek(self._key_count * KEY_SIZE)
+            keys = keys_file.read((count - self._key_count) * KEY_SIZE)
+            for i in range(count - self._key_count):
+                self._index[keys[i * KEY_SIZE:(i + 1) * KEY_SIZE]] = self._key_count + i
+            self._key_count = count
+        self._ensure_capacity(count)
+
+    def _create(self, dim: int):
+        self.dim = dim
+        open(self._vectors_path, 'wb').close()
+        # Written last, other processes only read the cache once meta.json exists
+        with open(self._meta_path, 'w', encoding='utf-8') as f:
+            json.dump({'model': self.model_name, 'dim': dim}, f)
+
+    def _ensure_capacity(self, size: int):
+        """Map at least `size` rows of vectors.f32, growing the file when needed."""
+        on_disk = os.path.getsize(self._vectors_path) // (self.dim * 4)
+        if size > on_disk:
+            capacity = max(size, on_disk * 2, self.initial_capacity)
+            with open(self._vectors_path, 'r+b') as f:
+                f.truncate(capacity * self.dim * 4)
+        else:
+            # Another process may have grown the file already
+            capacity = on_disk
+        if capacity == 0 or (capacity == self._capacity and self._vectors is not None):
+            return
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._vectors = None
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode='r+', shape=(capacity, self.dim))
+        self._capacity = capacity
+
+    def get(self, keys: List[bytes]) -> List[Union[np.ndarray, None]]:
+        """Return the cached vector for every key, or None when it is missing."""
+        with self.lock:
+            return [
+                np.array(self._vectors[self._index[key]]) if key in self._index else None
+                for key in keys
+            ]
+
+    def put(self, keys: List[bytes], vectors: np.ndarray):
+        """Store vectors for keys that are not cached yet."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self.lock, self._locked_keys() as keys_file:
+            self._refresh(keys_file)
+            if self.dim is None:
+                self._create(vectors.shape[1])
+
+            new_rows = {}
+            for key, vector in zip(keys, vectors):
+                if key not in self._index and key not in new_rows:
+                    new_rows[key] = vector
+            if not new_rows:
+                return
+
+            start = self._key_count
+            self._ensure_capacity(start + len(new_rows))
+            self._vectors[start:start + len(new_rows)] = np.stack(list(new_rows.values()))
+            self._vectors.flush()
+
+            # Append keys only once their vectors are on disk
+            keys_file.write(b''.join(new_rows.keys()))
+            keys_file.flush()
+            for offset, key in enumerate(new_rows):
+                self._index[key] = start + offset
+            self._key_count = start + len(new_rows)
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    Wrap any `BaseEmbedding` (or object with an `encode` method) with a persistent
+    `EmbeddingCache`. Only texts missing from the cache are sent to the model.
+    """
+    def __init__(self, embedding, cache_dir: str = './embedding_cache', name: str = None):
+        super().__init__(name or embedding.name)
+        self.embedding = embedding
+        self.cache = EmbeddingCache.open(cache_dir, self.name)
+
+    def encode(self, text: Union[str, List[str]], **kwargs):
+        texts = [text] if isinstance(text, str) else list(text)
+        keys = [self.cache.key(t) for t in texts]
+        vectors = self.cache.get(keys)
+
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            encoded = np.asarray(self.embedding.encode([texts[i] for i in missing], **kwargs), dtype=np.float32)
+            self.cache.put([keys[i] for i in missing], encoded)
+            for i, vector in zip(missing, encoded):
+                vectors[i] = vector
+
+        if isinstance(text, str):
+            return vectors[0]
+        if not vectors:
+            return np.empty((0, self.cache.dim or 0), dtype=np.float32)
+        return np.stack(vectors)
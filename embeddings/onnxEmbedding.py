@@ -0,0 +1,164 @@
+import os
+import re
+import numpy as np
+from typing import List, Literal, Optional, Union
+from embeddings import BaseEmbedding
+
+ONNX_OUTPUTS = {
+    'feature-extraction': 'last_hidden_state',
+    'sequence-classification': 'logits',
+}
+
+
+def export_onnx_model(
+        model_name: str,
+        onnx_dir: str = './onnx_models',
+        task: Literal['feature-extraction', 'sequence-classification'] = 'feature-extraction',
+        quantize: bool = False,
+        opset: int = 17,
+    ) -> str:
+    """
+    Export a HuggingFace encoder to ONNX, optionally with dynamic int8 quantization.
+
+    The export is cached in `onnx_dir/<model>/`, so it only runs once per model.
+
+    Args:
+        model_name (str): HuggingFace model repository ID.
+        onnx_dir (str): Directory to store exported models.
+        task (str): 'feature-extraction' for embedding models, 'sequence-classification'
+            for cross-encoders.
+        quantize (bool): Also write a dynamically int8-quantized copy and return it.
+        opset (int): ONNX opset version.
+
+    Returns:
+        str: Path of the ONNX model to load.
+    """
+    import torch
+    from transformers import AutoModel, AutoModelForSequenceClassification, AutoTokenizer
+
+    model_dir = os.path.join(onnx_dir, re.sub(r'[^\w.-]', '_', model_name))
+    fp32_path = os.path.join(model_dir, 'model.onnx')
+    int8_path = os.path.join(model_dir, 'model_int8.onnx')
+    os.makedirs(model_dir, exist_ok=True)
+
+    if not os.path.exists(fp32_path):
+        print(f"📦 Exporting {model_name} to ONNX ({task})...")
+        tokenizer = AutoTokenizer.from_pretrained(model_name, trust_remote_code=True)
+        model_class = AutoModel if task == 'feature-extraction' else AutoModelForSequenceClassification
+        model = model_class.from_pretrained(model_name, trust_remote_code=True)
+        model.eval()
+
+        dummy = tokenizer(["xin chào", "điện thoại"], ["xin chào", "điện thoại"] if task != 'feature-extraction' else None,
+                          padding=True, return_tensors='pt')
+        input_names = list(dummy.keys())
+        output_name = ONNX_OUTPUTS[task]
+        dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+        dynamic_axes[output_name] = {0: 'batch'} if task != 'feature-extraction' else {0: 'batch', 1: 'sequence'}
+
+        with torch.no_grad():
+            torch.onnx.export(
+                model,
+                tuple(dummy[name] for name in input_names),
+                fp32_path,
+                input_names=input_names,
+                output_names=[output_name],
+                dynamic_axes=dynamic_axes,
+                opset_version=opset,
+                do_constant_folding=True,
+            )
+        tokenizer.save_pretrained(model_dir)
+        print(f"✅ Exported ONNX model to: {fp32_path}")
+
+    if not quantize:
+        return fp32_path
+
+    if not os.path.exists(int8_path):
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        print("🔧 Applying dynamic int8 quantization...")
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+        print(f"✅ Quantized ONNX model to: {int8_path}")
+    return int8_path
+
+
+def create_onnx_session(model_path: str, intra_op_threads: Optional[int] = None):
+    """ONNX Runtime CPU session with full graph optimizations and tuned intra-op threads."""
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    options.intra_op_num_threads = intra_op_threads or os.cpu_count() or 1
+    options.inter_op_num_threads = 1
+    return ort.InferenceSession(model_path, sess_options=options, providers=['CPUExecutionProvider'])
+
+
+class ONNXEmbedding(BaseEmbedding):
+    """
+    Sentence embedding model exported to ONNX and run with ONNX Runtime.
+
+    `name` carries the backend ("<model>@onnx" / "<model>@onnx-int8"), so the
+    embedding cache and the semantic router index never mix its vectors with
+    the torch model's, or int8 vectors with fp32 ones.
+    """
+    def __init__(
+            self,
+            name: str = 'Alibaba-NLP/gte-multilingual-base',
+            onnx_dir: str = './onnx_models',
+            quantize: bool = True,
+            pooling: Literal['cls', 'mean'] = 'cls',
+            normalize: bool = True,
+            max_length: int = 512,
+            batch_size: int = 32,
+            intra_op_threads: Optional[int] = None,
+        ):
+        """
+        Args:
+            name (str): HuggingFace model repository ID.
+            onnx_dir (str): Directory to store exported models.
+            quantize (bool): Use the dynamically int8-quantized model.
+            pooling (str): 'cls' (gte models) or 'mean' token pooling.
+            normalize (bool): L2-normalize embeddings, as the SentenceTransformer does.
+            max_length (int): Max tokens per text.
+            batch_size (int): Default number of texts per inference call.
+            intra_op_threads (int, optional): ONNX Runtime intra-op threads, defaults to all cores.
+        """
+        super().__init__(name=f"{name}@{'onnx-int8' if quantize else 'onnx'}")
+        from transformers import AutoTokenizer
+
+        self.model_name = name
+        self.pooling = pooling
+        self.normalize = normalize
+        self.max_length = max_length
+        self.batch_size = batch_size
+
+        model_path = export_onnx_model(name, onnx_dir=onnx_dir, task='feature-extraction', quantize=quantize)
+        self.session = create_onnx_session(model_path, intra_op_threads=intra_op_threads)
+        self.input_names = [inp.name for inp in self.session.get_inputs()]
+        self.tokenizer = AutoTokenizer.from_pretrained(os.path.dirname(model_path))
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        inputs = self.tokenizer(texts, padding=True, truncation=True, max_length=self.max_length, return_tensors='np')
+        feeds = {name: inputs[name].astype(np.int64) for name in self.input_names}
+        hidden = self.session.run(None, feeds)[0]
+
+        if self.pooling == 'cls':
+            embeddings = hidden[:, 0]
+        else:
+            mask = inputs['attention_mask'][..., None].astype(np.float32)
+            embeddings = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+        if self.normalize:
+            embeddings = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        return embeddings.astype(np.float32)
+
+    def encode(self, text: Union[str, List[str]], batch_size: Optional[int] = None, **kwargs):
+        texts = [text] if isinstance(text, str) else list(text)
+        batch_size = batch_size or self.batch_size
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+
+        embeddings = np.concatenate([
+            self._encode_batch(texts[start:start + batch_size])
+            for start in range(0, len(texts), batch_size)
+        ])
+        return embeddings[0] if isinstance(text, str) else embeddings
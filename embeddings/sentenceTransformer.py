@@ -8,5 +8,5 @@ class SentenceTransformerEmbedding(BaseEmbedding):
         self.config = config
         self.embedding_model = SentenceTransformer(self.config.name, trust_remote_code=True)
 
-    def encode(self, text: str):
-        return self.embedding_model.encode(text)
+    def encode(self, text: str, **kwargs):
+        return self.embedding_model.encode(text, **kwargs)
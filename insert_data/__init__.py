@@ -1,2 +1,3 @@
 from insert_data.build_chromadb import load_csv_to_chromadb
-from insert_data.build_chromadb import csv_exists
\ No newline at end of file
+from insert_data.build_chromadb import csv_exists
+from insert_data.pipeline import load_csv_folder_to_chromadb
@@ -2,9 +2,18 @@ import pandas as pd
 import ast  # To safely parse string to list
 import chromadb
 from chromadb.config import Settings
-from sentence_transformers import SentenceTransformer
 import argparse
 import os 
+import time
+import json
+import hashlib
+from typing import Optional
+from embeddings import BaseEmbedding, CachedEmbedding
+from model_registry import get_embedding
+from rag.bm25 import BM25Index
+from insert_data.metadata import build_typed_metadata
+
+METADATA_COLUMNS = ['title', 'current_price', 'product_promotion', 'product_specs', 'color_options']
 
 class DataNotFoundError(Exception):
     def __init__(self):
@@ -26,51 +35,270 @@ def csv_exists(file_name: str) -> bool:
     return os.path.isfile(file_name)
 
 
-def load_csv_to_chromadb(csv_path: str, persist_dir: str = "./chroma_db", model_name: str = "Alibaba-NLP/gte-multilingual-base"):
-    # Load CSV
-    if csv_exists(file_name=csv_path):
-        df = pd.read_csv(csv_path)
-    else:
-        raise DataNotFoundError
+def get_collection_name(model_name: str) -> str:
+    """Collection name used for a given embedding model (e.g. "gte-multilingual-base")."""
+    return model_name.split('/')[-1]
+
+
+def get_bm25_path(persist_dir: str, model_name: str) -> str:
+    """Path of the BM25 index stored next to the chromadb collection."""
+    return os.path.join(persist_dir, f"bm25_{get_collection_name(model_name)}.pkl")
+
+
+def load_bm25_index(collection, bm25_path: str, page_size: int) -> BM25Index:
+    """
+    BM25 index of the collection. When the file is missing but the collection is
+    not empty (ingested before BM25 existed), it is rebuilt from the stored
+    documents, so an incremental run does not leave it with the changed rows only.
+    """
+    if os.path.exists(bm25_path):
+        return BM25Index.load(bm25_path)
+
+    bm25 = BM25Index()
+    if collection.count() > 0:
+        print(f"BM25 index not found, rebuilding it from collection `{collection.name}`...")
+        offset = 0
+        while True:
+            page = collection.get(include=['documents'], limit=page_size, offset=offset)
+            if len(page['ids']) == 0:
+                break
+            bm25.add(page['ids'], page['documents'])
+            offset += page_size
+    return bm25
+
+
+def get_ingest_marker_path(persist_dir: str, model_name: str) -> str:
+    """Path of the marker rewritten after every ingest into the collection."""
+    return os.path.join(persist_dir, f"ingest_{get_collection_name(model_name)}.json")
+
+
+def write_ingest_marker(persist_dir: str, model_name: str, collection):
+    """Record the row count and time of the last ingest, so readers detect changes without a scan."""
+    path = get_ingest_marker_path(persist_dir, model_name)
+    with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+        json.dump({'count': collection.count(), 'ingested_at': time.time_ns()}, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def read_ingest_marker(persist_dir: str, model_name: str) -> Optional[dict]:
+    """Marker written by `write_ingest_marker`, None for collections ingested before it existed."""
+    path = get_ingest_marker_path(persist_dir, model_name)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
 
-    if 'combined_infomation' in df.columns:
+
+def prepare_chunk(df: pd.DataFrame) -> pd.DataFrame:
+    """Build the `combined_information` column for one chunk of the CSV."""
+    if 'combined_information' in df.columns:
         df = df.drop(columns=['combined_information'])
 
-    df['combined_information'] = df.apply(lambda row: ', '.join(f"{col}: {row[col]}" for col in df.columns), axis=1)
+    columns = list(df.columns)
+    df['combined_information'] = [
+        ', '.join(f"{col}: {value}" for col, value in zip(columns, row))
+        for row in df[columns].itertuples(index=False, name=None)
+    ]
+    return df
 
-    # Load sentence embedding model
-    model = SentenceTransformer(model_name, trust_remote_code=True)
 
-    # Generate embeddings from 'combined_information' column
-    df['embedding'] = df['combined_information'].apply(lambda x: model.encode(x).tolist())
+def content_hash(text: str) -> str:
+    """Hash of a row's `combined_information`, used to detect changed rows."""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
 
-    # Connect to ChromaDB
+
+def build_metadatas(df: pd.DataFrame, source: str) -> list:
+    """Metadata stored next to every vector in Chroma, including the typed filter fields."""
+    return [
+        {
+            **{column: row[column] for column in METADATA_COLUMNS},
+            **build_typed_metadata(row),
+            "content_hash": content_hash(row['combined_information']),
+            "source": source
+        }
+        for row in df[METADATA_COLUMNS + ['combined_information']].to_dict(orient='records')
+    ]
+
+
+def iter_batches(size: int, batch_size: int):
+    """Yield (start, end) slices covering `size` items in `batch_size` steps."""
+    for start in range(0, size, batch_size):
+        yield start, min(start + batch_size, size)
+
+
+def get_existing_hashes(collection, ids: list) -> dict:
+    """Return {id: content_hash} for the ids already stored in the collection."""
+    existing = collection.get(ids=ids, include=['metadatas'])
+    return {
+        _id: (metadata or {}).get('content_hash')
+        for _id, metadata in zip(existing['ids'], existing['metadatas'])
+    }
+
+
+def get_source_ids(collection, source: str, page_size: int) -> list:
+    """Return every id in the collection that was ingested from `source`."""
+    ids = []
+    offset = 0
+    while True:
+        page = collection.get(where={"source": source}, include=[], limit=page_size, offset=offset)
+        ids.extend(page['ids'])
+        if len(page['ids']) < page_size:
+            return ids
+        offset += page_size
+
+
+def load_embedding_model(model_name: str) -> BaseEmbedding:
+    """SentenceTransformer used to embed the rows, shared through the model registry."""
+    return get_embedding(model_name)
+
+
+def get_chromadb_collection(persist_dir: str, model_name: str):
+    """Return (client, collection) of the chromadb store for `model_name`."""
     client = chromadb.PersistentClient(path=persist_dir)
+    collection = client.get_or_create_collection(name=get_collection_name(model_name))
+    return client, collection
 
-    if '/' in model_name:
-      collection_name = model_name.split('/')[1]
-    else:
-      collection_name = model_name
-    collection = client.get_or_create_collection(name=collection_name)
-
-    # Add to Chroma
-    collection.add(
-        ids=df['_id'].astype(str).tolist(),
-        documents=df['combined_information'].tolist(),
-        embeddings=df['embedding'].tolist(),
-        metadatas=[
-            {
-                "title": row['title'],
-                "current_price": row['current_price'],
-                "product_promotion": row['product_promotion'],
-                "product_specs": row['product_specs'],
-                "color_options": row['color_options']
-            }
-            for _, row in df.iterrows()
-        ]
-    )
 
-    print(f"{len(df)} items added to collection `{collection_name}`.")
+def read_csv_chunks(csv_path: str, chunk_size: int):
+    """Yield prepared chunks of a CSV file, with string ids and their Chroma metadata."""
+    source = os.path.basename(csv_path)
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_size):
+        chunk = prepare_chunk(chunk)
+        chunk['_id'] = chunk['_id'].astype(str)
+        chunk['metadata'] = build_metadatas(chunk, source=source)
+        yield chunk
+
+
+def filter_changed_rows(collection, chunk: pd.DataFrame) -> pd.DataFrame:
+    """Drop the rows whose content hash matches the one already stored in Chroma."""
+    existing_hashes = get_existing_hashes(collection, chunk['_id'].tolist())
+    changed = [
+        existing_hashes.get(_id) != metadata['content_hash']
+        for _id, metadata in zip(chunk['_id'], chunk['metadata'])
+    ]
+    return chunk[changed]
+
+
+def write_records(collection, ids, documents, embeddings, metadatas, write_batch_size: int, upsert: bool = False):
+    """Write records to Chroma in batches of at most `write_batch_size`."""
+    write = collection.upsert if upsert else collection.add
+    for start, end in iter_batches(len(ids), write_batch_size):
+        write(
+            ids=ids[start:end],
+            documents=documents[start:end],
+            embeddings=embeddings[start:end].tolist(),
+            metadatas=metadatas[start:end]
+        )
+
+
+def delete_stale_ids(collection, source: str, seen_ids: set, page_size: int, write_batch_size: int) -> list:
+    """Delete ids ingested from `source` that are not in `seen_ids` anymore and return them."""
+    stale_ids = [_id for _id in get_source_ids(collection, source, page_size) if _id not in seen_ids]
+    for start, end in iter_batches(len(stale_ids), write_batch_size):
+        collection.delete(ids=stale_ids[start:end])
+    return stale_ids
+
+
+def load_csv_to_chromadb(
+        csv_path: str,
+        persist_dir: str = "./chroma_db",
+        model_name: str = "Alibaba-NLP/gte-multilingual-base",
+        chunk_size: int = 2048,
+        batch_size: int = 32,
+        write_batch_size: int = None,
+        incremental: bool = False,
+        model: BaseEmbedding = None,
+        cache_dir: str = None,
+    ):
+    """
+    Stream a CSV file into ChromaDB.
+
+    The file is read `chunk_size` rows at a time, every chunk is embedded with a
+    single batched `encode` call and written with bounded `add` calls, so memory
+    stays flat regardless of the file size. The BM25 index used by hybrid search
+    is updated with the same rows.
+
+    Args:
+        csv_path (str): Path of the CSV file.
+        persist_dir (str): Directory of the chromadb vector store.
+        model_name (str): SentenceTransformer model used to embed the rows.
+        chunk_size (int): Number of CSV rows read and embedded per chunk.
+        batch_size (int): Batch size passed to `SentenceTransformer.encode`.
+        write_batch_size (int, optional): Max records per `collection.add` call.
+            Defaults to the client's max batch size.
+        incremental (bool): Only re-embed and upsert rows whose content hash
+            changed since the last ingest of this file, and delete ids that are
+            no longer present in it.
+        model (BaseEmbedding, optional): Already loaded embedding model,
+            so callers ingesting several files load it only once.
+        cache_dir (str, optional): Directory of a persistent embedding cache;
+            rows whose text is already cached are not sent to the model.
+    """
+    if not csv_exists(file_name=csv_path):
+        raise DataNotFoundError
+
+    # Load sentence embedding model
+    if model is None:
+        model = load_embedding_model(model_name)
+    if cache_dir:
+        model = CachedEmbedding(model, cache_dir=cache_dir, name=getattr(model, 'name', model_name))
+
+    # Connect to ChromaDB
+    client, collection = get_chromadb_collection(persist_dir, model_name)
+
+    max_batch_size = client.get_max_batch_size()
+    write_batch_size = min(write_batch_size or max_batch_size, max_batch_size)
+
+    bm25_path = get_bm25_path(persist_dir, model_name)
+    bm25 = load_bm25_index(collection, bm25_path, max_batch_size)
+
+    seen_ids = set()
+    total_rows = 0
+    embedded_rows = 0
+    start_time = time.perf_counter()
+
+    for chunk in read_csv_chunks(csv_path, chunk_size):
+        total_rows += len(chunk)
+
+        if incremental:
+            seen_ids.update(chunk['_id'])
+            # Skip rows whose content is unchanged since the last ingest
+            chunk = filter_changed_rows(collection, chunk)
+
+        if len(chunk) > 0:
+            documents = chunk['combined_information'].tolist()
+
+            # Generate embeddings for the whole chunk in one call
+            embeddings = model.encode(documents, batch_size=batch_size, show_progress_bar=False)
+
+            write_records(
+                collection,
+                ids=chunk['_id'].tolist(),
+                documents=documents,
+                embeddings=embeddings,
+                metadatas=chunk['metadata'].tolist(),
+                write_batch_size=write_batch_size,
+                upsert=incremental
+            )
+            bm25.add(chunk['_id'].tolist(), documents)
+            embedded_rows += len(chunk)
+
+        elapsed = max(time.perf_counter() - start_time, 1e-9)
+        print(f"  {total_rows} rows processed, {embedded_rows} embedded ({total_rows / elapsed:.1f} rows/s)")
+
+    deleted_rows = 0
+    if incremental:
+        stale_ids = delete_stale_ids(
+            collection, os.path.basename(csv_path), seen_ids, max_batch_size, write_batch_size
+        )
+        bm25.remove(stale_ids)
+        deleted_rows = len(stale_ids)
+    bm25.save(bm25_path)
+    write_ingest_marker(persist_dir, model_name, collection)
+
+    elapsed = max(time.perf_counter() - start_time, 1e-9)
+    print(f"{embedded_rows}/{total_rows} items written to collection `{collection.name}`, "
+          f"{deleted_rows} removed in {elapsed:.1f}s ({total_rows / elapsed:.1f} rows/s).")
 
 # Example usage
 if __name__ == "__main__":
@@ -79,6 +307,20 @@ if __name__ == "__main__":
     parser.add_argument("--csv_path", type=str, required=True, help="Declare CSV data file to embedding.")
     parser.add_argument("--persist_dir", type=str, default="./chroma_db", help="Default directory to store chromadb vector store.")
     parser.add_argument("--model_name", type=str, default="Alibaba-NLP/gte-multilingual-base", help="Choose model to embedding.")
+    parser.add_argument("--chunk_size", type=int, default=2048, help="Number of CSV rows read and embedded at a time.")
+    parser.add_argument("--batch_size", type=int, default=32, help="Batch size of the embedding model.")
+    parser.add_argument("--write_batch_size", type=int, default=None, help="Max records per chromadb add call.")
+    parser.add_argument("--incremental", action="store_true", help="Only re-embed changed rows and delete rows removed from the CSV.")
+    parser.add_argument("--cache_dir", type=str, default=None, help="Directory of the persistent embedding cache (optional).")
 
     args = parser.parse_args()
-    load_csv_to_chromadb(csv_path=args.csv_path, persist_dir=args.persist_dir, model_name=args.model_name)
+    load_csv_to_chromadb(
+        csv_path=args.csv_path,
+        persist_dir=args.persist_dir,
+        model_name=args.model_name,
+        chunk_size=args.chunk_size,
+        batch_size=args.batch_size,
+        write_batch_size=args.write_batch_size,
+        incremental=args.incremental,
+        cache_dir=args.cache_dir,
+    )
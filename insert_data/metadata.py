@@ -0,0 +1,107 @@
+import re
+from typing import Optional
+
+# Brand -> lowercase words that identify it in a product title or a query
+BRAND_ALIASES = {
+    'apple': ['iphone', 'apple'],
+    'samsung': ['samsung', 'galaxy'],
+    'xiaomi': ['xiaomi', 'redmi', 'poco'],
+    'oppo': ['oppo'],
+    'vivo': ['vivo'],
+    'realme': ['realme'],
+    'nokia': ['nokia'],
+    'honor': ['honor'],
+    'huawei': ['huawei'],
+    'motorola': ['motorola', 'moto'],
+    'sony': ['sony', 'xperia'],
+    'oneplus': ['oneplus'],
+    'google': ['pixel', 'google'],
+    'asus': ['asus', 'rog phone', 'zenfone'],
+    'tecno': ['tecno'],
+    'infinix': ['infinix'],
+    'itel': ['itel'],
+    'masstel': ['masstel'],
+    'benco': ['benco'],
+}
+
+RAM_PATTERNS = [
+    re.compile(r'\bRAM\s*:?\s*(\d+(?:[.,]\d+)?)\s*GB', re.IGNORECASE),
+    re.compile(r'\b(\d+(?:[.,]\d+)?)\s*GB\s*RAM\b', re.IGNORECASE),
+    # "8GB/256GB" in titles
+    re.compile(r'\b(\d+)\s*GB\s*/\s*\d+\s*(?:GB|TB)\b', re.IGNORECASE),
+]
+
+STORAGE_PATTERNS = [
+    re.compile(r'(?:ROM|bộ nhớ trong|dung lượng lưu trữ|lưu trữ)\s*:?\s*(\d+)\s*(GB|TB)', re.IGNORECASE),
+    re.compile(r'\b\d+\s*GB\s*/\s*(\d+)\s*(GB|TB)\b', re.IGNORECASE),
+    # "iPhone 15 (128GB)" in titles
+    re.compile(r'\(\s*(\d+)\s*(GB|TB)\s*\)', re.IGNORECASE),
+]
+
+
+def _is_missing(value) -> bool:
+    return value is None or (isinstance(value, float) and value != value)
+
+
+def parse_price(value) -> Optional[int]:
+    """Parse a VND price such as "22.878.334 ₫" into 22878334."""
+    if _is_missing(value):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    digits = re.sub(r'\D', '', str(value))
+    return int(digits) if digits else None
+
+
+def parse_brand(text) -> Optional[str]:
+    """Return the canonical brand mentioned in a title or query, if any."""
+    if _is_missing(text):
+        return None
+    text = str(text).lower()
+    for brand, aliases in BRAND_ALIASES.items():
+        if any(re.search(rf'\b{re.escape(alias)}\b', text) for alias in aliases):
+            return brand
+    return None
+
+
+def _first_match(patterns, texts) -> Optional[re.Match]:
+    for text in texts:
+        if _is_missing(text):
+            continue
+        for pattern in patterns:
+            match = pattern.search(str(text))
+            if match:
+                return match
+    return None
+
+
+def parse_ram_gb(*texts) -> Optional[float]:
+    """RAM in GB found in the product specs or title."""
+    match = _first_match(RAM_PATTERNS, texts)
+    return float(match.group(1).replace(',', '.')) if match else None
+
+
+def parse_storage_gb(*texts) -> Optional[int]:
+    """Storage in GB found in the product specs or title (1TB = 1024GB)."""
+    match = _first_match(STORAGE_PATTERNS, texts)
+    if not match:
+        return None
+    size = int(match.group(1))
+    return size * 1024 if match.group(2).upper() == 'TB' else size
+
+
+def build_typed_metadata(row: dict) -> dict:
+    """
+    Typed fields used by metadata filters: `price` (int, VND), `brand` (str),
+    `ram_gb` (float) and `storage_gb` (int). Fields that cannot be parsed are
+    left out, since vector stores do not accept null metadata.
+    """
+    title = row.get('title')
+    specs = row.get('product_specs')
+    typed = {
+        'price': parse_price(row.get('current_price')),
+        'brand': parse_brand(title),
+        'ram_gb': parse_ram_gb(specs, title),
+        'storage_gb': parse_storage_gb(specs, title),
+    }
+    return {key: value for key, value in typed.items() if value is not None}
@@ -0,0 +1,228 @@
+import os
+import time
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+from embeddings import BaseEmbedding, CachedEmbedding
+from insert_data.build_chromadb import (
+    csv_exists,
+    DataNotFoundError,
+    load_embedding_model,
+    get_chromadb_collection,
+    get_bm25_path,
+    load_bm25_index,
+    write_ingest_marker,
+    read_csv_chunks,
+    filter_changed_rows,
+    write_records,
+    delete_stale_ids,
+)
+
+
+def _put_until_stopped(chunks, item, stop) -> bool:
+    """Put on a bounded queue, giving up once `stop` is set so workers never hang."""
+    while not stop.is_set():
+        try:
+            chunks.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def parse_csv_file(csv_path: str, chunk_size: int, chunks, stop) -> int:
+    """
+    Parse a CSV file in a worker process and send its prepared chunks one at a
+    time through the bounded `chunks` queue, followed by a ('done', ...) message.
+    """
+    rows = 0
+    try:
+        for chunk in read_csv_chunks(csv_path, chunk_size):
+            if not _put_until_stopped(chunks, ('chunk', csv_path, chunk), stop):
+                return rows
+            rows += len(chunk)
+    except Exception as e:
+        _put_until_stopped(chunks, ('error', csv_path, repr(e)), stop)
+        raise
+    _put_until_stopped(chunks, ('done', csv_path, rows), stop)
+    return rows
+
+
+class ChromaWriter(threading.Thread):
+    """Single writer thread that drains encoded batches into one Chroma collection."""
+
+    def __init__(self, collection, write_batch_size: int, upsert: bool, queue_size: int = 8):
+        super().__init__(daemon=True)
+        self.collection = collection
+        self.write_batch_size = write_batch_size
+        self.upsert = upsert
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.error = None
+        self.written_rows = 0
+
+    def put(self, ids, documents, embeddings, metadatas):
+        if self.error is not None:
+            raise self.error
+        self.queue.put((ids, documents, embeddings, metadatas))
+
+    def close(self, raise_error: bool = True):
+        """Write the queued batches and stop; `raise_error=False` when already unwinding an error."""
+        self.queue.put(None)
+        self.join()
+        if raise_error and self.error is not None:
+            raise self.error
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if self.error is not None:
+                # Keep draining so the producer never blocks on a full queue
+                continue
+            ids, documents, embeddings, metadatas = item
+            try:
+                write_records(
+                    self.collection, ids, documents, embeddings, metadatas,
+                    write_batch_size=self.write_batch_size, upsert=self.upsert
+                )
+                self.written_rows += len(ids)
+            except Exception as e:
+                self.error = e
+
+
+def load_csv_folder_to_chromadb(
+        csv_paths: List[str],
+        persist_dir: str = "./chroma_db",
+        model_name: str = "Alibaba-NLP/gte-multilingual-base",
+        workers: int = None,
+        chunk_size: int = 2048,
+        batch_size: int = 32,
+        write_batch_size: int = None,
+        incremental: bool = False,
+        model: BaseEmbedding = None,
+        cache_dir: str = None,
+        max_pending_chunks: int = 4,
+    ):
+    """
+    Ingest several CSV files into one ChromaDB collection.
+
+    The embedding model is loaded once and files are parsed in a process pool.
+    Workers are spawned, not forked: this process already runs the writer thread
+    and holds the loaded model, and a fork would copy locks held by other threads.
+    Workers send chunk-sized results through a bounded queue, so memory stays
+    flat and parsing of the next chunks overlaps with encoding; a single writer
+    thread adds encoded chunks to Chroma while the next chunk is being encoded.
+    The BM25 index used by hybrid search is updated alongside.
+
+    Args:
+        csv_paths (list): Paths of the CSV files.
+        persist_dir (str): Directory of the chromadb vector store.
+        model_name (str): SentenceTransformer model used to embed the rows.
+        workers (int, optional): Number of parsing processes. Defaults to
+            min(number of files, number of CPUs).
+        chunk_size (int): Number of rows encoded per `encode` call.
+        batch_size (int): Batch size passed to `SentenceTransformer.encode`.
+        write_batch_size (int, optional): Max records per Chroma write call.
+        incremental (bool): Same as in `load_csv_to_chromadb`, applied per file.
+        model (BaseEmbedding, optional): Already loaded embedding model.
+        cache_dir (str, optional): Directory of a persistent embedding cache.
+        max_pending_chunks (int): Parsed chunks buffered between the workers and
+            the encoder.
+    """
+    for csv_path in csv_paths:
+        if not csv_exists(file_name=csv_path):
+            raise DataNotFoundError
+
+    if model is None:
+        model = load_embedding_model(model_name)
+    if cache_dir:
+        model = CachedEmbedding(model, cache_dir=cache_dir, name=getattr(model, 'name', model_name))
+
+    client, collection = get_chromadb_collection(persist_dir, model_name)
+    max_batch_size = client.get_max_batch_size()
+    write_batch_size = min(write_batch_size or max_batch_size, max_batch_size)
+
+    bm25_path = get_bm25_path(persist_dir, model_name)
+    bm25 = load_bm25_index(collection, bm25_path, max_batch_size)
+
+    writer = ChromaWriter(collection, write_batch_size=write_batch_size, upsert=incremental)
+    writer.start()
+
+    workers = workers or min(len(csv_paths), os.cpu_count() or 1)
+    total_rows = 0
+    deleted_rows = 0
+    start_time = time.perf_counter()
+
+    context = multiprocessing.get_context('spawn')
+    try:
+        with context.Manager() as manager, \
+                ProcessPoolExecutor(max_workers=max(workers, 1), mp_context=context) as executor:
+            chunks = manager.Queue(maxsize=max_pending_chunks)
+            stop = manager.Event()
+            futures = [
+                executor.submit(parse_csv_file, csv_path, chunk_size, chunks, stop)
+                for csv_path in csv_paths
+            ]
+            seen_ids = {csv_path: set() for csv_path in csv_paths}
+            processed = 0
+
+            try:
+                while processed < len(csv_paths):
+                    try:
+                        kind, csv_path, payload = chunks.get(timeout=1)
+                    except queue.Empty:
+                        # A worker that died without reporting would otherwise be waited on forever
+                        for future in futures:
+                            if future.done() and future.exception() is not None:
+                                raise future.exception()
+                        continue
+
+                    if kind == 'error':
+                        raise RuntimeError(f"Failed to parse {csv_path}: {payload}")
+
+                    if kind == 'done':
+                        processed += 1
+                        if incremental:
+                            stale_ids = delete_stale_ids(
+                                collection, os.path.basename(csv_path), seen_ids[csv_path],
+                                max_batch_size, write_batch_size
+                            )
+                            bm25.remove(stale_ids)
+                            deleted_rows += len(stale_ids)
+                        seen_ids.pop(csv_path)
+
+                        elapsed = max(time.perf_counter() - start_time, 1e-9)
+                        print(f"Processed {processed}/{len(csv_paths)} files: {os.path.basename(csv_path)} "
+                              f"({total_rows / elapsed:.1f} rows/s)")
+                        continue
+
+                    chunk = payload
+                    total_rows += len(chunk)
+                    if incremental:
+                        seen_ids[csv_path].update(chunk['_id'])
+                        chunk = filter_changed_rows(collection, chunk)
+                    if len(chunk) == 0:
+                        continue
+
+                    documents = chunk['combined_information'].tolist()
+                    embeddings = model.encode(documents, batch_size=batch_size, show_progress_bar=False)
+                    writer.put(chunk['_id'].tolist(), documents, embeddings, chunk['metadata'].tolist())
+                    bm25.add(chunk['_id'].tolist(), documents)
+            except BaseException:
+                # Unblock workers waiting on the full queue before the pool shuts down
+                stop.set()
+                raise
+    except BaseException:
+        # Keep the original error, a writer failure would only hide it
+        writer.close(raise_error=False)
+        raise
+    writer.close()
+    bm25.save(bm25_path)
+    write_ingest_marker(persist_dir, model_name, collection)
+
+    elapsed = max(time.perf_counter() - start_time, 1e-9)
+    print(f"{writer.written_rows}/{total_rows} items written to collection `{collection.name}`, "
+          f"{deleted_rows} removed in {elapsed:.1f}s ({total_rows / elapsed:.1f} rows/s).")
@@ -1,6 +1,6 @@
 from llms.localLlms import LocalLLMs
 from llms.onlinesLlms import OnLineLLMs
-from typing import List, Dict
+from typing import List, Dict, Iterator, Optional
 
 class LLMs:
     def __init__(self, type : str, model_version: str, model_name : str = None, engine : str = None, api_key : str = None, base_url: str = None, **kwargs):
@@ -22,4 +22,20 @@ class LLMs:
         """
         return self.llm.generate_content(prompt)
 
-       
\ No newline at end of file
+    def stream_content(self, prompt: List[Dict[str,str]]) -> Iterator[str]:
+        """
+        Stream content generated by the LLM based on the provided prompt.
+        input: prompt (List[Dict[str,str]]): The chat messages to generate content for.
+        output: Iterator[str]: Chunks of the generated content, as soon as they are produced.
+        """
+        return self.llm.stream_content(prompt)
+
+    def batching_stats(self) -> Optional[dict]:
+        """Counters of the local batch scheduler, None when requests are not batched."""
+        batching_stats = getattr(self.llm, 'batching_stats', None)
+        return batching_stats() if batching_stats else None
+
+    def supports_system_prompt(self) -> bool:
+        """Whether the local engine takes a leading system message and caches its KV state."""
+        supports_system_prompt = getattr(self.llm, 'supports_system_prompt', None)
+        return supports_system_prompt() if supports_system_prompt else False
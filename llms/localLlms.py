@@ -1,9 +1,27 @@
 import requests
 import re
-from typing import List, Dict
-from transformers import AutoModelForCausalLM, AutoTokenizer
+import copy
+import contextlib
+from threading import Event, Lock, Thread
+from typing import List, Dict, Iterator, Optional, Tuple
+from transformers import AutoModelForCausalLM, AutoTokenizer, TextIteratorStreamer, DynamicCache, StoppingCriteria, StoppingCriteriaList
 import torch
 from llms.onnx import ONNXModel
+from llms.streaming import filter_think_blocks, iter_sse_events, iter_ndjson
+from llms.scheduler import BatchScheduler
+from llms.transport import get_transport
+from rag.cache import LRUCache
+
+
+class _EventStoppingCriteria(StoppingCriteria):
+    """Stop `generate` once the event is set, e.g. when a stream's client went away."""
+    def __init__(self, event: Event):
+        self.event = event
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), self.event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+
 class LocalLLMs:
     def __init__(self, engine: str, model_version: str, base_url: str = None, **kwargs):
         """ Initialize the LocalLLMs class 
@@ -11,10 +29,28 @@ class LocalLLMs:
             engine (str): "ollama" or "vllm".
             model_version (str): name of model ("llama3","meta-llama/Llama-2-7b-chat-hf").
             base_url (str, optional): BASE URL of server engine.
+            batching (bool, optional): "huggingface" and "onnx" only, run concurrent
+                `generate_content` requests as padded batches on a background scheduler.
+                Streams are not batched: each one runs on its own, taking turns with
+                the scheduler's batches so the model never runs both at once.
+            max_batch_size (int, optional): Max requests per batch, default 8.
+            max_batch_wait_ms (float, optional): How long a request waits for others
+                to join its batch, default 10.
+            prefix_cache_size (int, optional): "onnx" and "huggingface" only, number of
+                leading system prompts whose KV state is kept, default 8 (0 disables).
+                Batched requests are prefilled in full, only single requests and
+                streams reuse the cached prefixes.
         """
         self.engine = engine
         self.model_version = model_version
         self.client = None
+        self.scheduler = None
+        # Taken by the scheduler's batches and by streams when batching is enabled
+        self._generation_lock = Lock()
+        self.prefix_cache = LRUCache(maxsize=kwargs.get('prefix_cache_size', 8))
+        # One lock per prefix being prefilled, so concurrent first requests prefill it once
+        self._prefix_locks = {}
+        self._prefix_locks_lock = Lock()
         self.max_tokens = kwargs.get('max_tokens', 4096)  # Default max tokens
         if engine == "ollama":
             self.base_url = base_url 
@@ -31,13 +67,29 @@ class LocalLLMs:
         else:
             raise ValueError(f"Unsupported engine: {engine}")
 
+        if kwargs.get('batching', False) and engine in ("huggingface", "onnx"):
+            run_batch = self._huggingface_generate_batch if engine == "huggingface" else self._onnx_generate_batch
+
+            def run_batch_exclusive(prompts):
+                with self._generation_lock:
+                    return run_batch(prompts)
+
+            self.scheduler = BatchScheduler(
+                run_batch_exclusive,
+                max_batch_size=kwargs.get('max_batch_size', 8),
+                max_wait_ms=kwargs.get('max_batch_wait_ms', 10)
+            )
+            if self.prefix_cache.maxsize:
+                print("⚠️ Batched requests do not use the prefix cache, it only serves streamed requests")
+
     def _initialize_ollama_model(self, model_version: str):
         """Pull the specified model from the Ollama server."""
         try:
-            response = requests.get(self.base_url, timeout=5)
+            # Pooled keep-alive session with retries, shared by every HTTP client
+            self.client = get_transport()
+            response = self.client.get(self.base_url, timeout=5)
             response.raise_for_status()
             print("Kết nối đến máy chủ Ollama thành công.")
-            self.client = requests.Session()
             self._pull_ollama_model(model_version)
         except requests.exceptions.RequestException as e:
             raise ConnectionError(f"Không thể kết nối đến máy chủ Ollama tại {self.base_url}. Vui lòng đảm bảo Ollama đang chạy. Lỗi: {e}")
@@ -55,7 +107,8 @@ class LocalLLMs:
             if not model_exists:
                 print(f"Model '{model_version}' chưa tồn tại. Bắt đầu tải...")
                 pull_data = {"name": model_version}
-                pull_response = self.client.post(f"{self.base_url}/api/pull", json=pull_data)
+                # Downloading a model can take much longer than the default read timeout
+                pull_response = self.client.post(f"{self.base_url}/api/pull", json=pull_data, timeout=(5, None))
                 pull_response.raise_for_status()
                 print(f"Tải model '{model_version}' thành công.")
             else:
@@ -66,7 +119,8 @@ class LocalLLMs:
     def _initialize_vllm_model(self, model_version: str):
         """Initialize the vLLM model with the specified name and parameters."""
         try:
-            response = requests.get(f"{self.base_url}/v1/models", timeout=10)
+            self.client = get_transport()
+            response = self.client.get(f"{self.base_url}/v1/models", timeout=10)
             response.raise_for_status()
             models = response.json().get("data", [])
             matched_model = next((m for m in models if m["id"] == self.model_version), None)
@@ -78,7 +132,6 @@ class LocalLLMs:
                 print(f"Không tìm thấy model '{self.model_version}' trong danh sách model của vLLM. Dùng giá trị mặc định 4096.")
 
             print("Kết nối đến vLLM server thành công.")
-            self.client = requests.Session()
         except requests.exceptions.RequestException as e:
             raise ConnectionError(f"Không thể kết nối đến vLLM tại {self.base_url}. Lỗi: {e}")
     
@@ -94,6 +147,7 @@ class LocalLLMs:
         # Add pad token if missing
         if self.tokenizer.pad_token is None:
             self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.tokenizer.padding_side = "left"
         self.client = AutoModelForCausalLM.from_pretrained(
             model_version,
             torch_dtype="auto",
@@ -103,6 +157,34 @@ class LocalLLMs:
         ).to(device)
         self.client.eval()
 
+    def batching_stats(self) -> Optional[dict]:
+        """Counters of the batch scheduler, None when batching is disabled."""
+        return self.scheduler.stats() if self.scheduler else None
+
+    def supports_system_prompt(self) -> bool:
+        """Whether a leading system message can be sent, so its KV state is reused across requests.
+
+        Only the huggingface and onnx engines cache that prefix. The ONNX models use ChatML,
+        HuggingFace chat templates are tried once: some (Gemma, older Mistral) reject the
+        system role or silently drop it.
+        """
+        if self.engine == 'onnx':
+            return True
+        if self.engine != 'huggingface':
+            return False
+        marker = "system prompt probe"
+        try:
+            text = self._huggingface_chat_text(
+                [{"role": "system", "content": marker}, {"role": "user", "content": "?"}]
+            )
+        except Exception:
+            return False
+        return marker in text
+
+    def _stream_guard(self):
+        """Streams bypass the scheduler, they wait for its current batch instead of running beside it."""
+        return self._generation_lock if self.scheduler else contextlib.nullcontext()
+
     def remove_think_blocks(self,text):
         """Remove <think> blocks and their content from text"""
         # Pattern to match <think>...</think> blocks (including multiline)
@@ -150,56 +232,239 @@ class LocalLLMs:
                 response.raise_for_status()
                 response_data = response.json()["choices"][0]["message"]["content"].strip()
                 return self.remove_think_blocks(response_data)
+            elif self.engine in ('huggingface', 'onnx') and self.scheduler:
+                # Batched with concurrent requests by the scheduler thread
+                response_data = self.scheduler.submit(prompt).result()
+                return self.remove_think_blocks(response_data)
             elif self.engine == 'huggingface':
-                # messages = [
-                #     {"role": "user", "content": prompt}
-                # ]
-                import torch 
-                messages = prompt
-                text = self.tokenizer.apply_chat_template(
-                    messages,
-                    tokenize=False,
-                    add_generation_prompt=True,
-                    enable_thinking=False # thinking mode unabled
-                )
-
-                model_inputs = self.tokenizer([text], return_tensors="pt").to(self.client.device)
+                model_inputs = self._huggingface_inputs(prompt)
 
                 # conduct text completion
                 with torch.no_grad():
-                    generated_ids = self.client.generate(
-                        **model_inputs,
-                        max_new_tokens=self.max_tokens,
-                        do_sample=True,
-                        temperature=0.7,
-                        top_p=0.9,
-                        pad_token_id=self.tokenizer.eos_token_id,
-                        eos_token_id=self.tokenizer.eos_token_id,
-                        use_cache=True
-                    )
-                output_ids = generated_ids[0][len(model_inputs.input_ids[0]):].tolist() 
+                    generated_ids = self.client.generate(**model_inputs, **self._huggingface_generate_kwargs())
+                output_ids = generated_ids[0][len(model_inputs["input_ids"][0]):].tolist() 
 
                 response_data = self.tokenizer.decode(output_ids, skip_special_tokens=True)
                 return self.remove_think_blocks(response_data)
             elif self.engine == "onnx":
-                # TODO: Will find the prompt template of each model
-                if isinstance(prompt, list):
-                    prompt_text = ""
-                    for msg in prompt:
-                        if msg["role"] == "system":
-                            prompt_text += f"<|im_start|>system\n{msg['content']}<|im_end|>\n"
-                        elif msg["role"] == "user":
-                            prompt_text += f"<|im_start|>user\n{msg['content']}<|im_end|>\n"
-                        elif msg["role"] == "assistant":
-                            prompt_text += f"<|im_start|>assistant\n{msg['content']}<|im_end|>\n"
-                    prompt_text += "<|im_start|>assistant\n"  # Model is expected to complete from here
-                else:
-                    prompt_text = prompt  # Assume already formatted
-                
-                output = self.onnx_model.generate(prompt_text)
+                prompt_text, prefix_state = self._onnx_inputs(prompt)
+                output = self.onnx_model.generate(prompt_text, prefix_state=prefix_state, **self._onnx_generate_kwargs())
                 return self.remove_think_blocks(output)
 
         except Exception as e:
             print(f"Đã xảy ra lỗi trong quá trình tạo nội dung: {e}")
             raise
+
+    def _system_prefix(self, prompt) -> List[Dict[str,str]]:
+        """Leading system messages: the part of the prompt shared across requests."""
+        if not isinstance(prompt, list):
+            return []
+        count = 0
+        while count < len(prompt) and prompt[count].get("role") == "system":
+            count += 1
+        return prompt[:count]
+
+    def _prefix_state(self, prefix_text: str, prefill):
+        """KV state of a prompt prefix, computed by `prefill` on the first request only."""
+        state = self.prefix_cache.get(prefix_text)
+        if state is not None:
+            return state
+
+        with self._prefix_locks_lock:
+            lock = self._prefix_locks.setdefault(prefix_text, Lock())
+        with lock:
+            # Another request may have prefilled it while this one waited
+            state = self.prefix_cache.get(prefix_text)
+            if state is None:
+                state = prefill(prefix_text)
+                self.prefix_cache.put(prefix_text, state)
+        with self._prefix_locks_lock:
+            if self._prefix_locks.get(prefix_text) is lock:
+                del self._prefix_locks[prefix_text]
+        return state
+
+    def _huggingface_chat_text(self, prompt: List[Dict[str,str]], add_generation_prompt: bool = True) -> str:
+        return self.tokenizer.apply_chat_template(
+            prompt,
+            tokenize=False,
+            add_generation_prompt=add_generation_prompt,
+            enable_thinking=False # thinking mode unabled
+        )
+
+    def _huggingface_prefill(self, prefix_text: str) -> Tuple[torch.Tensor, DynamicCache]:
+        prefix_ids = self.tokenizer([prefix_text], return_tensors="pt").input_ids.to(self.client.device)
+        with torch.no_grad():
+            outputs = self.client(prefix_ids, past_key_values=DynamicCache(), use_cache=True)
+        return prefix_ids, outputs.past_key_values
+
+    def _huggingface_inputs(self, prompt: List[Dict[str,str]]) -> dict:
+        """Tokenize chat messages with the model's chat template.
+
+        When the prompt starts with system messages, their KV cache is taken from
+        the prefix cache so `generate` only prefills the rest of the conversation.
+        """
+        text = self._huggingface_chat_text(prompt)
+        prefix = self._system_prefix(prompt)
+        if prefix and self.prefix_cache.maxsize:
+            prefix_text = self._huggingface_chat_text(prefix, add_generation_prompt=False)
+            if text.startswith(prefix_text):
+                prefix_ids, prefix_cache = self._prefix_state(prefix_text, self._huggingface_prefill)
+                rest_ids = self.tokenizer(
+                    [text[len(prefix_text):]], return_tensors="pt", add_special_tokens=False
+                ).input_ids.to(self.client.device)
+                input_ids = torch.cat([prefix_ids, rest_ids], dim=1)
+                return {
+                    "input_ids": input_ids,
+                    "attention_mask": torch.ones_like(input_ids),
+                    # generate() appends to the cache, the shared prefix must stay intact
+                    "past_key_values": copy.deepcopy(prefix_cache),
+                }
+        return dict(self.tokenizer([text], return_tensors="pt").to(self.client.device))
+
+    def _huggingface_generate_batch(self, prompts: List[List[Dict[str,str]]]) -> List[str]:
+        """Run one left-padded `generate` call for several conversations."""
+        texts = [self._huggingface_chat_text(prompt) for prompt in prompts]
+        # Decoder-only models continue from the last position, so pad on the left
+        model_inputs = self.tokenizer(texts, return_tensors="pt", padding=True).to(self.client.device)
+
+        # Finished sequences are padded with eos until the whole batch is done
+        with torch.no_grad():
+            generated_ids = self.client.generate(**model_inputs, **self._huggingface_generate_kwargs())
+        output_ids = generated_ids[:, model_inputs.input_ids.shape[1]:]
+        return self.tokenizer.batch_decode(output_ids, skip_special_tokens=True)
+
+    def _huggingface_generate_kwargs(self) -> dict:
+        return dict(
+            max_new_tokens=self.max_tokens,
+            do_sample=True,
+            temperature=0.7,
+            top_p=0.9,
+            pad_token_id=self.tokenizer.eos_token_id,
+            eos_token_id=self.tokenizer.eos_token_id,
+            use_cache=True
+        )
+
+    def _onnx_prompt(self, prompt) -> str:
+        """Format chat messages with the ChatML template used by the ONNX models."""
+        if not isinstance(prompt, list):
+            return prompt  # Assume already formatted
+        return self._onnx_messages_text(prompt) + "<|im_start|>assistant\n"  # Model is expected to complete from here
+
+    def _onnx_inputs(self, prompt) -> Tuple[str, Optional[tuple]]:
+        """Prompt text for the ONNX model and, when it starts with system messages,
+        the cached KV state of that prefix (the returned text then excludes it)."""
+        prompt_text = self._onnx_prompt(prompt)
+        prefix = self._system_prefix(prompt)
+        if not prefix or not self.prefix_cache.maxsize:
+            return prompt_text, None
+        prefix_text = self._onnx_messages_text(prefix)
+        return prompt_text[len(prefix_text):], self._prefix_state(prefix_text, self.onnx_model.prefill)
+
+    def _onnx_generate_batch(self, prompts: List[List[Dict[str,str]]]) -> List[str]:
+        """Run one left-padded ONNX generation for several conversations."""
+        return self.onnx_model.generate_batch(
+            [self._onnx_prompt(prompt) for prompt in prompts], **self._onnx_generate_kwargs()
+        )
+
+    def _onnx_generate_kwargs(self) -> dict:
+        # Same decoding settings as the huggingface engine
+        return dict(
+            max_new_tokens=self.max_tokens,
+            do_sample=True,
+            temperature=0.7,
+            top_p=0.9
+        )
+
+    def _onnx_messages_text(self, messages: List[Dict[str,str]]) -> str:
+        # TODO: Will find the prompt template of each model
+        prompt_text = ""
+        for msg in messages:
+            if msg["role"] == "system":
+                prompt_text += f"<|im_start|>system\n{msg['content']}<|im_end|>\n"
+            elif msg["role"] == "user":
+                prompt_text += f"<|im_start|>user\n{msg['content']}<|im_end|>\n"
+            elif msg["role"] == "assistant":
+                prompt_text += f"<|im_start|>assistant\n{msg['content']}<|im_end|>\n"
+        return prompt_text
+
+    def stream_content(self, prompt: List[Dict[str,str]]) -> Iterator[str]:
+        """Stream content generated by the local LLM, with <think> blocks removed.
+            input: prompt (List[Dict[str,str]]): Chat messages.
+            output: Iterator[str]: Text chunks, in generation order.
+        """
+        if not self.client:
+            raise RuntimeError("Client chưa được khởi tạo. Vui lòng kiểm tra lại cấu hình.")
+
+        print(f"Đang stream nội dung với engine '{self.engine}' và model '{self.model_version}'...")
+        return filter_think_blocks(self._stream_raw(prompt))
+
+    def _stream_raw(self, prompt: List[Dict[str,str]]) -> Iterator[str]:
+        if self.engine == 'ollama':
+            payload = {
+                "model": self.model_version,
+                "messages": prompt,
+                "stream": True
+            }
+            with self.client.post(f"{self.base_url}/api/chat", json=payload, stream=True) as response:
+                response.raise_for_status()
+                for event in iter_ndjson(response):
+                    yield event.get("message", {}).get("content", "")
+                    if event.get("done"):
+                        break
+
+        elif self.engine == 'vllm':
+            payload = {
+                "model": self.model_version,
+                "messages": prompt,
+                "stream": True
+            }
+            with self.client.post(
+                f"{self.base_url}/v1/chat/completions",
+                headers={"Content-Type": "application/json"},
+                json=payload,
+                stream=True
+            ) as response:
+                response.raise_for_status()
+                for event in iter_sse_events(response):
+                    if event.get("choices"):
+                        yield event["choices"][0].get("delta", {}).get("content") or ""
+
+        elif self.engine == 'huggingface':
+            model_inputs = self._huggingface_inputs(prompt)
+            streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+            stop = Event()
+            errors = []
+
+            def generate():
+                try:
+                    with self._stream_guard(), torch.no_grad():
+                        self.client.generate(
+                            **model_inputs, **self._huggingface_generate_kwargs(), streamer=streamer,
+                            stopping_criteria=StoppingCriteriaList([_EventStoppingCriteria(stop)])
+                        )
+                except Exception as e:
+                    print(f"Đã xảy ra lỗi trong quá trình tạo nội dung: {e}")
+                    errors.append(e)
+                    # Unblock the consumer
+                    streamer.end()
+
+            # generate() blocks, so it runs in a thread while the streamer is consumed here
+            thread = Thread(target=generate, daemon=True)
+            thread.start()
+            try:
+                yield from streamer
+            finally:
+                # The consumer may be gone (client disconnected): stop generating after the current step
+                stop.set()
+                thread.join()
+            if errors:
+                raise errors[0]
+
+        elif self.engine == "onnx":
+            prompt_text, prefix_state = self._onnx_inputs(prompt)
+            with self._stream_guard():
+                yield from self.onnx_model.stream(prompt_text, prefix_state=prefix_state, **self._onnx_generate_kwargs())
+
+        else:
+            raise ValueError(f"Unsupported engine: {self.engine}")
         
\ No newline at end of file
@@ -1,8 +1,9 @@
 import google.generativeai as genai
 import openai
-import requests
 import re
-from typing import List, Dict
+from typing import List, Dict, Iterator
+from llms.streaming import filter_think_blocks, iter_sse_events
+from llms.transport import get_transport
 
 class OnLineLLMs:
     def __init__(self, model_name: str, api_key: str, model_version: str, base_url: str = None):
@@ -21,6 +22,7 @@ class OnLineLLMs:
                 "Authorization": f"Bearer {api_key}",
                 "Content-Type": "application/json"
             }
+            self.transport = get_transport()
         else:
             raise ValueError("Unsupported model name or missing API key.")
 
@@ -63,7 +65,7 @@ class OnLineLLMs:
                 "top_p": 0.9,
                 "max_tokens": 512,
             }
-            response = requests.post(
+            response = self.transport.post(
                 self.base_url,
                 headers=self.headers,
                 json=data,
@@ -74,3 +76,55 @@ class OnLineLLMs:
             return self.remove_think_blocks(response_data)
         else:
             raise ValueError(f"Unsupported model name: {self.name}")
+
+    def stream_content(self, prompt: List[Dict[str, str]]) -> Iterator[str]:
+        """Stream content generated by the online LLM, with <think> blocks removed.
+            input: prompt (List[Dict[str, str]]): Chat messages.
+            output: Iterator[str]: Text chunks, in generation order.
+        """
+        return filter_think_blocks(self._stream_raw(prompt))
+
+    def _stream_raw(self, prompt: List[Dict[str, str]]) -> Iterator[str]:
+        if self.model_name == "gemini":
+            gemini_messages = [
+                {"role": msg["role"], "parts": [msg["content"]]} for msg in prompt
+            ]
+            for chunk in self.model.generate_content(gemini_messages, stream=True):
+                try:
+                    yield chunk.text
+                except ValueError:
+                    # Chunks without text parts (e.g. safety ratings only)
+                    continue
+
+        elif self.model_name == "openai":
+            stream = self.client.chat.completions.create(
+                model=self.model_version,
+                messages=prompt,
+                stream=True
+            )
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+
+        elif self.model_name == "together":
+            data = {
+                "model": self.model_version,
+                "messages": prompt,
+                "temperature": 0.7,
+                "top_p": 0.9,
+                "max_tokens": 512,
+                "stream": True,
+            }
+            with self.transport.post(
+                self.base_url,
+                headers=self.headers,
+                json=data,
+                timeout=60,
+                stream=True
+            ) as response:
+                response.raise_for_status()
+                for event in iter_sse_events(response):
+                    if event.get("choices"):
+                        yield event["choices"][0].get("delta", {}).get("content") or ""
+        else:
+            raise ValueError(f"Unsupported model name: {self.model_name}")
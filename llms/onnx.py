@@ -3,10 +3,12 @@ import re
 import os
 import numpy as np
 import onnxruntime as ort
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Iterator, Optional, Tuple
 from transformers import AutoTokenizer, AutoConfig
 from huggingface_hub import snapshot_download
 import time
+from llms.sampling import sample_next_tokens
+
 
 class ONNXModel:
     """ONNX model wrapper for efficient inference"""
@@ -26,7 +28,9 @@ class ONNXModel:
         self.output_names = []
         self.num_layers = 28
         self.num_heads = 8
+        self.num_kv_heads = 8
         self.head_dim = 128
+        self.kv_dtype = np.float32
         
         self._initialize_model()
     
@@ -70,6 +74,8 @@ class ONNXModel:
         self.tokenizer = AutoTokenizer.from_pretrained(self.model_version)
         if self.tokenizer.pad_token is None:
             self.tokenizer.pad_token = self.tokenizer.eos_token
+        # Batches are left-padded so every sequence continues from the last column
+        self.tokenizer.padding_side = "left"
         
         # Get model architecture info
         self.input_names = [inp.name for inp in self.onnx_session.get_inputs()]
@@ -81,7 +87,23 @@ class ONNXModel:
         print(f"✅ ONNX Model loaded successfully!")
         print(f"   - Input tensors: {len(self.input_names)}")
         print(f"   - Output tensors: {len(self.output_names)}")
-        print(f"   - Layers: {self.num_layers}, Heads: {self.num_heads}, Head dim: {self.head_dim}")
+        print(f"   - Layers: {self.num_layers}, Heads: {self.num_heads}, KV heads: {self.num_kv_heads}, Head dim: {self.head_dim}")
+
+    def _detect_kv_cache_layout(self) -> bool:
+        """Read KV cache layout from the graph inputs (past_key_values.{i}.key: [batch, kv_heads, past, head_dim])"""
+        past_keys = [inp for inp in self.onnx_session.get_inputs()
+                     if inp.name.startswith('past_key_values.') and inp.name.endswith('.key')]
+        if not past_keys:
+            return False
+        self.kv_dtype = np.float16 if past_keys[0].type == 'tensor(float16)' else np.float32
+
+        shape = past_keys[0].shape
+        if len(shape) != 4 or not isinstance(shape[1], int) or not isinstance(shape[3], int):
+            return False
+        self.num_layers = len(past_keys)
+        self.num_kv_heads = shape[1]
+        self.head_dim = shape[3]
+        return True
 
     def _detect_model_architecture(self):
         """Auto-detect or set model architecture parameters"""
@@ -108,11 +130,14 @@ class ONNXModel:
                 self.num_heads = getattr(config, 'num_attention_heads', 
                                        getattr(config, 'n_head', 
                                              getattr(config, 'num_heads', 8)))
+
+                # Grouped-query attention caches fewer heads than it attends with
+                self.num_kv_heads = getattr(config, 'num_key_value_heads', None) or self.num_heads
                 
-                # Calculate head_dim from hidden_size and num_heads
+                # head_dim is explicit on some models (Qwen3: 128 != hidden_size / num_heads)
                 hidden_size = getattr(config, 'hidden_size', 
                                     getattr(config, 'd_model', 1024))
-                self.head_dim = hidden_size // self.num_heads
+                self.head_dim = getattr(config, 'head_dim', None) or hidden_size // self.num_heads
                 
                 print(f"🔍 Auto-detected config from model config")
                 
@@ -121,21 +146,28 @@ class ONNXModel:
                 print("🔧 Using default Qwen3-0.6B configuration")
                 # Default fallback to Qwen3-0.6B specs
                 self.num_layers = 28
-                self.num_heads = 8  
+                self.num_heads = 16
+                self.num_kv_heads = 8
                 self.head_dim = 128
 
-    def set_architecture(self, num_layers: int, num_heads: int, head_dim: int):
+        # The graph inputs are authoritative for the cache layout
+        if self._detect_kv_cache_layout():
+            print(f"🔍 KV cache layout read from ONNX inputs")
+
+    def set_architecture(self, num_layers: int, num_heads: int, head_dim: int, num_kv_heads: Optional[int] = None):
         """Manually set model architecture parameters
         
         Args:
             num_layers (int): Number of transformer layers
             num_heads (int): Number of attention heads
             head_dim (int): Dimension of each attention head
+            num_kv_heads (int, optional): Number of key/value heads, defaults to num_heads
         """
         self.num_layers = num_layers
         self.num_heads = num_heads
+        self.num_kv_heads = num_kv_heads or num_heads
         self.head_dim = head_dim
-        print(f"🔧 Manual config set - Layers: {self.num_layers}, Heads: {self.num_heads}, Head dim: {self.head_dim}")
+        print(f"🔧 Manual config set - Layers: {self.num_layers}, Heads: {self.num_heads}, KV heads: {self.num_kv_heads}, Head dim: {self.head_dim}")
 
     def prepare_inputs(self, input_ids: np.ndarray, 
                       attention_mask: Optional[np.ndarray] = None,
@@ -182,9 +214,9 @@ class ONNXModel:
             value_name = f'past_key_values.{layer_idx}.value'
 
             if past_key_values is None:
-                cache_shape = (batch_size, self.num_heads, 0, self.head_dim)
-                inputs[key_name] = np.zeros(cache_shape, dtype=np.float32)
-                inputs[value_name] = np.zeros(cache_shape, dtype=np.float32)
+                cache_shape = (batch_size, self.num_kv_heads, 0, self.head_dim)
+                inputs[key_name] = np.zeros(cache_shape, dtype=self.kv_dtype)
+                inputs[value_name] = np.zeros(cache_shape, dtype=self.kv_dtype)
             else:
                 inputs[key_name] = past_key_values[key_name]
                 inputs[value_name] = past_key_values[value_name]
@@ -221,15 +253,165 @@ class ONNXModel:
         
         return next_token_id, new_kv_cache
 
+    def _present_names(self) -> Dict[str, str]:
+        """Map of present output names to the past input they feed"""
+        return {
+            name: name.replace('present.', 'past_key_values.', 1)
+            for name in self.output_names if name.startswith('present.')
+        }
+
+    def _empty_past(self, batch_size: int) -> Dict[str, "ort.OrtValue"]:
+        empty_cache = ort.OrtValue.ortvalue_from_numpy(
+            np.zeros((batch_size, self.num_kv_heads, 0, self.head_dim), dtype=self.kv_dtype)
+        )
+        return {past_name: empty_cache for past_name in self._present_names().values()}
+
+    def _run_step(self, input_ids: np.ndarray, attention_mask: np.ndarray, position_ids: np.ndarray,
+                  past: Dict[str, "ort.OrtValue"]) -> Tuple[np.ndarray, Dict[str, "ort.OrtValue"]]:
+        """One forward pass through IO binding, returns last-position logits and the new past"""
+        logits_name = self.output_names[0]
+        present_names = self._present_names()
+
+        binding = self.onnx_session.io_binding()
+        binding.bind_cpu_input('input_ids', input_ids)
+        binding.bind_cpu_input('attention_mask', np.ascontiguousarray(attention_mask))
+        if 'position_ids' in self.input_names:
+            binding.bind_cpu_input('position_ids', np.ascontiguousarray(position_ids))
+        for past_name, value in past.items():
+            binding.bind_ortvalue_input(past_name, value)
+        binding.bind_output(logits_name, 'cpu')
+        for present_name in present_names:
+            binding.bind_output(present_name, 'cpu')
+
+        self.onnx_session.run_with_iobinding(binding)
+        outputs = dict(zip(self.output_names, binding.get_outputs()))
+
+        logits = outputs[logits_name].numpy()[:, -1, :]
+        new_past = {past_name: outputs[present_name] for present_name, past_name in present_names.items()}
+        return logits, new_past
+
+    def prefill(self, prompt: str) -> Tuple[Dict[str, "ort.OrtValue"], int]:
+        """Run a prompt prefix through the model and return its KV state
+
+        The state can be passed as `prefix_state` to `generate` / `stream` for any
+        prompt continuing this prefix; it is only read, so one state can be shared
+        by concurrent generations.
+
+        Returns:
+            Tuple[Dict[str, OrtValue], int]: Past KV tensors and prefix length in tokens
+        """
+        input_ids = self.tokenizer.encode(prompt, return_tensors="np").astype(np.int64)
+        batch_size, length = input_ids.shape
+        attention_mask = np.ones((batch_size, length), dtype=np.int64)
+        position_ids = np.tile(np.arange(length, dtype=np.int64), (batch_size, 1))
+        _, past = self._run_step(input_ids, attention_mask, position_ids, self._empty_past(batch_size))
+        return past, length
+
+    def _generate_batch_ids(self, input_ids: np.ndarray, max_new_tokens: int,
+                            attention_mask: Optional[np.ndarray] = None,
+                            prefix_state: Optional[Tuple[Dict, int]] = None,
+                            step_latencies: Optional[List[float]] = None,
+                            **sampling) -> Iterator[np.ndarray]:
+        """Generation loop over a (left-padded) batch, yields one token id per sequence per step
+
+        Runs through IO binding: the attention mask and position ids are allocated
+        once for the whole generation and bound as prefix views, and the present
+        KV tensors stay ORT-owned OrtValues that are bound back as the next step's
+        past inputs without a round-trip through numpy. With `prefix_state`,
+        generation resumes after an already prefilled prefix. Sequences that hit
+        EOS keep producing pad tokens until every sequence is finished.
+
+        State is per call, so concurrent generations (scheduler batches, streams)
+        never share it: the random generator is local, and the model latency of
+        each step is appended to `step_latencies` when given.
+        """
+        batch_size, prompt_length = input_ids.shape
+        past, start = prefix_state if prefix_state is not None else (self._empty_past(batch_size), 0)
+        capacity = start + prompt_length + max_new_tokens
+
+        full_attention_mask = np.ones((batch_size, capacity), dtype=np.int64)
+        if attention_mask is not None:
+            full_attention_mask[:, start:start + prompt_length] = attention_mask
+        # Left padding shifts each row, so positions come from the mask rather than the column index
+        position_ids = np.maximum(np.cumsum(full_attention_mask, axis=1) - 1, 0)
+        next_input = np.empty((batch_size, 1), dtype=np.int64)
+        finished = np.zeros(batch_size, dtype=bool)
+        eos_token_id = self.tokenizer.eos_token_id
+        pad_token_id = self.tokenizer.pad_token_id if self.tokenizer.pad_token_id is not None else eos_token_id
+
+        rng = np.random.default_rng()
+        current_input = input_ids.astype(np.int64)
+        for step in range(max_new_tokens):
+            t0 = time.perf_counter()
+            end = start + current_input.shape[1]
+            try:
+                logits, past = self._run_step(
+                    current_input, full_attention_mask[:, :end], position_ids[:, start:end], past
+                )
+            except Exception as e:
+                print(f"❌ Error at step {step}: {e}")
+                break
+
+            next_tokens = sample_next_tokens(logits, rng=rng, **sampling)
+            next_tokens = np.where(finished, pad_token_id, next_tokens)
+            finished |= next_tokens == eos_token_id
+            if step_latencies is not None:
+                step_latencies.append(time.perf_counter() - t0)
+
+            yield next_tokens
+
+            if finished.all():
+                break
+            next_input[:, 0] = next_tokens
+            current_input = next_input
+            start = end
+
+    def _generate_ids(self, input_ids: np.ndarray, max_new_tokens: int,
+                      prefix_state: Optional[Tuple[Dict, int]] = None,
+                      step_latencies: Optional[List[float]] = None, **sampling) -> Iterator[int]:
+        """Single-sequence generation loop, yields token ids as soon as they are decoded"""
+        for next_tokens in self._generate_batch_ids(input_ids, max_new_tokens, prefix_state=prefix_state,
+                                                    step_latencies=step_latencies, **sampling):
+            yield int(next_tokens[0])
+
+    def _log_throughput(self, prompt_tokens: int, completion_tokens: int, elapsed: float,
+                        step_latencies: Optional[List[float]] = None):
+        elapsed = max(elapsed, 1e-9)  # guard div-by-zero
+        total_tokens = prompt_tokens + completion_tokens
+        tps = completion_tokens / elapsed
+
+        print(f"✅ Generated {completion_tokens} tokens in {elapsed:.3f}s "
+          f"({tps:.2f} tok/s) | prompt={prompt_tokens}, total={total_tokens}")
+
+        # Per-step model latency: first step is the prompt prefill, the rest decode one token each
+        if step_latencies:
+            decode = np.array(step_latencies[1:]) * 1000
+            prefill_ms = step_latencies[0] * 1000
+            if len(decode):
+                print(f"   ⏱️ prefill={prefill_ms:.1f}ms | decode step mean={decode.mean():.2f}ms "
+                      f"p50={np.percentile(decode, 50):.2f}ms p95={np.percentile(decode, 95):.2f}ms")
+            else:
+                print(f"   ⏱️ prefill={prefill_ms:.1f}ms")
+
+    def _encode_prompt(self, prompt: str, prefix_state: Optional[Tuple[Dict, int]]) -> np.ndarray:
+        # A continuation of a prefilled prefix must not get special tokens prepended again
+        return self.tokenizer.encode(prompt, return_tensors="np", add_special_tokens=prefix_state is None)
+
     def generate(self, prompt: str, max_new_tokens: int = 4096, 
-                temperature: float = 1.0, do_sample: bool = False) -> str:
+                temperature: float = 1.0, do_sample: bool = False,
+                prefix_state: Optional[Tuple[Dict, int]] = None,
+                top_k: int = 0, top_p: float = 1.0) -> str:
         """Generate text using ONNX model
         
         Args:
             prompt (str): Input prompt
             max_new_tokens (int): Maximum number of tokens to generate
-            temperature (float): Sampling temperature (not implemented yet)
-            do_sample (bool): Whether to use sampling (not implemented yet)
+            temperature (float): Sampling temperature
+            do_sample (bool): Whether to use sampling, greedy decoding otherwise
+            prefix_state (tuple, optional): State from `prefill`; `prompt` is then
+                the text following that prefix
+            top_k (int): Sample among the k most likely tokens (0 disables)
+            top_p (float): Sample among the smallest token set with this total probability
             
         Returns:
             str: Generated text
@@ -237,54 +419,91 @@ class ONNXModel:
         print(f"🚀 Generating with ONNX: '{prompt[:50]}...' (max_tokens: {max_new_tokens})")
         
         # Tokenize
-        input_ids = self.tokenizer.encode(prompt, return_tensors="np")
-        prompt_tokens = input_ids.shape[1]
-        
-        generated_tokens = []
-        kv_cache = None
+        input_ids = self._encode_prompt(prompt, prefix_state)
 
+        step_latencies = []
         t0 = time.perf_counter()
-        
-        # Generation loop
-        for step in range(max_new_tokens):
-            if step == 0:
-                current_input = input_ids
-            else:
-                current_input = np.array([[generated_tokens[-1]]], dtype=np.int64)
-            
-            try:
-                next_token_id, kv_cache = self.generate_token(
-                    current_input, 
-                    past_key_values=kv_cache
-                )
-                
-                generated_tokens.append(next_token_id)
-                
-                # Check for EOS
-                if next_token_id == self.tokenizer.eos_token_id:
-                    break
-                    
-            except Exception as e:
-                print(f"❌ Error at step {step}: {e}")
-                break
-
-        t1 = time.perf_counter()
-        elapsed = max(t1 - t0, 1e-9)  # guard div-by-zero
+        generated_tokens = list(self._generate_ids(
+            input_ids, max_new_tokens, prefix_state, step_latencies=step_latencies,
+            temperature=temperature, do_sample=do_sample, top_k=top_k, top_p=top_p
+        ))
+        self._log_throughput(input_ids.shape[1], len(generated_tokens), time.perf_counter() - t0, step_latencies)
 
-        
         # Decode generated text
-        generated_text = self.tokenizer.decode(generated_tokens, skip_special_tokens=True)
+        return self.tokenizer.decode(generated_tokens, skip_special_tokens=True)
 
+    def generate_batch(self, prompts: List[str], max_new_tokens: int = 4096,
+                       temperature: float = 1.0, do_sample: bool = False,
+                       top_k: int = 0, top_p: float = 1.0) -> List[str]:
+        """Generate text for several prompts in one left-padded batch
 
-        full_text = prompt + generated_text
-        completion_tokens = len(generated_tokens)
-        total_tokens = prompt_tokens + completion_tokens
-        tps = completion_tokens / elapsed
+        Args:
+            prompts (List[str]): Input prompts
+            max_new_tokens (int): Maximum number of tokens to generate per prompt
+            temperature, do_sample, top_k, top_p: Sampling options, as in `generate`
 
-        print(f"✅ Generated {completion_tokens} tokens in {elapsed:.3f}s "
-          f"({tps:.2f} tok/s) | prompt={prompt_tokens}, total={total_tokens}")
+        Returns:
+            List[str]: Generated text of each prompt, in order
+        """
+        print(f"🚀 Generating a batch of {len(prompts)} with ONNX (max_tokens: {max_new_tokens})")
+
+        encoded = self.tokenizer(prompts, return_tensors="np", padding=True)
+        input_ids = encoded["input_ids"].astype(np.int64)
+        attention_mask = encoded["attention_mask"].astype(np.int64)
+
+        step_latencies = []
+        t0 = time.perf_counter()
+        steps = list(self._generate_batch_ids(
+            input_ids, max_new_tokens, attention_mask=attention_mask, step_latencies=step_latencies,
+            temperature=temperature, do_sample=do_sample, top_k=top_k, top_p=top_p
+        ))
+        generated = np.stack(steps, axis=1) if steps else np.empty((len(prompts), 0), dtype=np.int64)
+
+        texts = []
+        completion_tokens = 0
+        for row in generated:
+            # Cut each sequence after its own EOS
+            eos_positions = np.flatnonzero(row == self.tokenizer.eos_token_id)
+            row = row[:eos_positions[0] + 1] if len(eos_positions) else row
+            completion_tokens += len(row)
+            texts.append(self.tokenizer.decode(row.tolist(), skip_special_tokens=True))
+        self._log_throughput(int(attention_mask.sum()), completion_tokens, time.perf_counter() - t0, step_latencies)
+        return texts
 
-        return generated_text
+    def stream(self, prompt: str, max_new_tokens: int = 4096,
+               prefix_state: Optional[Tuple[Dict, int]] = None,
+               temperature: float = 1.0, do_sample: bool = False,
+               top_k: int = 0, top_p: float = 1.0) -> Iterator[str]:
+        """Generate text using ONNX model, yielding text deltas as tokens are produced
+
+        Args:
+            prompt (str): Input prompt
+            max_new_tokens (int): Maximum number of tokens to generate
+            prefix_state (tuple, optional): State from `prefill`, as in `generate`
+            temperature, do_sample, top_k, top_p: Sampling options, as in `generate`
+
+        Yields:
+            str: Newly decoded text
+        """
+        print(f"🚀 Streaming with ONNX: '{prompt[:50]}...' (max_tokens: {max_new_tokens})")
+
+        input_ids = self._encode_prompt(prompt, prefix_state)
+        generated_tokens = []
+        emitted = 0
+
+        step_latencies = []
+        t0 = time.perf_counter()
+        for token_id in self._generate_ids(
+            input_ids, max_new_tokens, prefix_state, step_latencies=step_latencies,
+            temperature=temperature, do_sample=do_sample, top_k=top_k, top_p=top_p
+        ):
+            generated_tokens.append(token_id)
+            # Decode the whole completion so multi-token characters are emitted once complete
+            text = self.tokenizer.decode(generated_tokens, skip_special_tokens=True)
+            if len(text) > emitted and not text.endswith('\ufffd'):
+                yield text[emitted:]
+                emitted = len(text)
+        self._log_throughput(input_ids.shape[1], len(generated_tokens), time.perf_counter() - t0, step_latencies)
 
     def encode(self, text: str) -> np.ndarray:
         """Encode text to token IDs"""
@@ -300,6 +519,7 @@ class ONNXModel:
             "model_version": self.model_version,
             "num_layers": self.num_layers,
             "num_heads": self.num_heads,
+            "num_kv_heads": self.num_kv_heads,
             "head_dim": self.head_dim,
             "vocab_size": self.tokenizer.vocab_size,
             "input_names": self.input_names,
@@ -0,0 +1,38 @@
+import numpy as np
+from typing import Optional
+
+
+def sample_next_tokens(logits: np.ndarray, temperature: float = 1.0, do_sample: bool = False,
+                       top_k: int = 0, top_p: float = 1.0,
+                       rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """Pick the next token of every sequence from (batch, vocab) logits
+
+    Greedy unless `do_sample`; otherwise temperature, top-k and top-p (nucleus)
+    filtering are applied to the whole batch at once before sampling.
+    """
+    if not do_sample or temperature <= 0:
+        return np.argmax(logits, axis=-1)
+
+    rng = rng or np.random.default_rng()
+    logits = logits.astype(np.float32) / temperature
+    vocab_size = logits.shape[-1]
+
+    if 0 < top_k < vocab_size:
+        kth_largest = np.partition(logits, -top_k, axis=-1)[:, -top_k:].min(axis=-1, keepdims=True)
+        logits = np.where(logits < kth_largest, -np.inf, logits)
+
+    probs = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    probs /= probs.sum(axis=-1, keepdims=True)
+
+    if top_p < 1.0:
+        order = np.argsort(-probs, axis=-1)
+        sorted_probs = np.take_along_axis(probs, order, axis=-1)
+        # Drop tokens once the mass before them already reaches top_p; the top token is always kept
+        sorted_probs[np.cumsum(sorted_probs, axis=-1) - sorted_probs >= top_p] = 0.0
+        probs = np.zeros_like(probs)
+        np.put_along_axis(probs, order, sorted_probs, axis=-1)
+        probs /= probs.sum(axis=-1, keepdims=True)
+
+    # Inverse-CDF sampling, one uniform draw per sequence
+    draws = rng.random((probs.shape[0], 1))
+    return np.minimum((np.cumsum(probs, axis=-1) < draws).sum(axis=-1), vocab_size - 1)
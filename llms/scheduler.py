@@ -0,0 +1,98 @@
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, List
+
+
+class BatchScheduler:
+    """
+    Collect concurrent requests and run them as one batch on a background thread.
+
+    Callers `submit` a request and get a `Future`; the worker takes the first
+    queued request, waits up to `max_wait_ms` for more (up to `max_batch_size`),
+    calls `run_batch` once for the whole batch and resolves every future with
+    its own result.
+    """
+    def __init__(self, run_batch: Callable[[List[Any]], List[Any]], max_batch_size: int = 8, max_wait_ms: float = 10):
+        """
+        Args:
+            run_batch (Callable): Function mapping a list of requests to a list of
+                results in the same order.
+            max_batch_size (int): Max number of requests per batch.
+            max_wait_ms (float): How long the first request of a batch waits for
+                others to join it.
+        """
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue()
+        self.batches = 0
+        self.requests = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def submit(self, request: Any) -> Future:
+        """Queue a request, the returned future resolves to its result."""
+        if self._closed:
+            raise RuntimeError("BatchScheduler is closed")
+        future = Future()
+        self.queue.put((request, future))
+        return future
+
+    def close(self):
+        """Stop the worker once the queued requests are done."""
+        self._closed = True
+        self.queue.put(None)
+        self._thread.join()
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "mean_batch_size": self.requests / self.batches if self.batches else 0.0,
+            "queued": self.queue.qsize()
+        }
+
+    def _next_batch(self) -> List:
+        first = self.queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # Finish this batch, then stop
+                self.queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            # Drop requests whose caller cancelled the future while it was queued
+            batch = [(request, future) for request, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            self.batches += 1
+            self.requests += len(batch)
+            try:
+                results = self.run_batch([request for request, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
@@ -0,0 +1,92 @@
+import json
+from typing import Dict, Iterable, Iterator
+
+
+class ThinkBlockFilter:
+    """
+    Incremental version of `remove_think_blocks` for streamed text.
+
+    Text inside <think>...</think> is dropped even when a tag is split across
+    chunks: a chunk ending with a possible partial tag is held back until the
+    next chunk arrives. Leading whitespace of the answer is skipped.
+    """
+    OPEN = '<think>'
+    CLOSE = '</think>'
+
+    def __init__(self):
+        self.buffer = ''
+        self.inside = False
+        self.started = False
+
+    @staticmethod
+    def _partial_tag_length(text: str, tag: str) -> int:
+        """Length of the longest suffix of `text` that is a proper prefix of `tag`."""
+        for length in range(min(len(tag) - 1, len(text)), 0, -1):
+            if text.endswith(tag[:length]):
+                return length
+        return 0
+
+    def _emit(self, text: str) -> str:
+        if not self.started:
+            text = text.lstrip()
+            self.started = bool(text)
+        return text
+
+    def feed(self, chunk: str) -> str:
+        """Add a streamed chunk and return the text that can be shown."""
+        self.buffer += chunk
+        visible = []
+        while True:
+            tag = self.CLOSE if self.inside else self.OPEN
+            index = self.buffer.find(tag)
+            if index >= 0:
+                if not self.inside:
+                    visible.append(self.buffer[:index])
+                self.buffer = self.buffer[index + len(tag):]
+                self.inside = not self.inside
+                continue
+
+            keep = self._partial_tag_length(self.buffer, tag)
+            split = len(self.buffer) - keep
+            if not self.inside:
+                visible.append(self.buffer[:split])
+            self.buffer = self.buffer[split:]
+            return self._emit(''.join(visible))
+
+    def flush(self) -> str:
+        """Text held back at the end of the stream (an unclosed think block is dropped)."""
+        text = '' if self.inside else self.buffer
+        self.buffer = ''
+        return self._emit(text)
+
+
+def filter_think_blocks(chunks: Iterable[str]) -> Iterator[str]:
+    """Drop <think> blocks from a stream of text chunks."""
+    think_filter = ThinkBlockFilter()
+    for chunk in chunks:
+        text = think_filter.feed(chunk)
+        if text:
+            yield text
+    text = think_filter.flush()
+    if text:
+        yield text
+
+
+def iter_sse_events(response) -> Iterator[Dict]:
+    """JSON payloads of an OpenAI-compatible server-sent event stream (vLLM, Together)."""
+    for line in response.iter_lines():
+        # Decode as UTF-8 ourselves, requests falls back to latin-1 for text/event-stream
+        line = line.decode('utf-8').strip() if line else ''
+        if not line.startswith('data:'):
+            continue
+        data = line[len('data:'):].strip()
+        if data == '[DONE]':
+            break
+        yield json.loads(data)
+
+
+def iter_ndjson(response) -> Iterator[Dict]:
+    """Objects of a newline-delimited JSON stream (Ollama)."""
+    for line in response.iter_lines():
+        if line:
+            yield json.loads(line.decode('utf-8'))
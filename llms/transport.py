@@ -0,0 +1,136 @@
+import time
+import random
+import threading
+import requests
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+from typing import Optional, Tuple, Union
+
+# (connect, read) seconds; generation endpoints can take a while to answer
+DEFAULT_TIMEOUT = (5, 300)
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+# The server refused the work, so a non-idempotent request did not run and can be resent
+NOT_PROCESSED_STATUSES = frozenset({429, 503})
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+
+class HTTPTransport:
+    """
+    Pooled keep-alive HTTP session with retries, shared by the HTTP LLM clients.
+
+    Requests that could not connect (refused, connect timeout) are retried with
+    jittered exponential backoff; a `Retry-After` header takes precedence over
+    the computed delay. Idempotent methods are also retried on 429/5xx answers
+    and on a connection dropped after the request was sent (stale keep-alive,
+    server disconnect). Other methods are only resent on 429/503, which mean the
+    server did not process them, and read timeouts are never retried, so a
+    generation POST that may have run is never sent twice.
+    """
+    def __init__(self, pool_connections: int = 10, pool_maxsize: int = 32, max_retries: int = 3,
+                 backoff_base: float = 0.5, backoff_max: float = 8.0, max_retry_after: float = 60.0,
+                 timeout: Union[float, Tuple[float, Optional[float]]] = DEFAULT_TIMEOUT):
+        """
+        Args:
+            pool_connections (int): Number of hosts with a connection pool.
+            pool_maxsize (int): Max kept-alive connections per host.
+            max_retries (int): Retries after the first attempt.
+            backoff_base (float): Upper bound in seconds of the first retry delay,
+                doubled on every attempt.
+            backoff_max (float): Cap of the computed retry delay.
+            max_retry_after (float): Cap of a server-provided `Retry-After`.
+            timeout (float | tuple): Default (connect, read) timeout of a request.
+        """
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_retry_after = max_retry_after
+        self.timeout = timeout
+        self.retries = 0
+        self._retries_lock = threading.Lock()
+
+        self.session = requests.Session()
+        # Retries are handled here, urllib3 only keeps the connections alive
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Seconds to wait before retry number `attempt` (0-based)."""
+        if retry_after:
+            try:
+                return min(max(float(retry_after), 0.0), self.max_retry_after)
+            except ValueError:
+                try:
+                    delay = parsedate_to_datetime(retry_after).timestamp() - time.time()
+                    return min(max(delay, 0.0), self.max_retry_after)
+                except (TypeError, ValueError):
+                    pass
+        # Full jitter keeps concurrent clients from retrying in lockstep
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    @staticmethod
+    def _retryable_error(method: str, error: requests.exceptions.ConnectionError) -> bool:
+        """Whether a failed request can be sent again without running it twice on the server."""
+        if method.upper() in IDEMPOTENT_METHODS or isinstance(error, requests.exceptions.ConnectTimeout):
+            return True
+        # Connection refused / name resolution failure: nothing reached the server
+        reason = getattr(error.args[0], "reason", None) if error.args else None
+        return isinstance(reason, NewConnectionError)
+
+    @staticmethod
+    def _retryable_status(method: str, status: int) -> bool:
+        """Whether a request answered with `status` can be sent again."""
+        if method.upper() in IDEMPOTENT_METHODS:
+            return status in RETRY_STATUSES
+        # A 500/502/504 may come after the generation already ran
+        return status in NOT_PROCESSED_STATUSES
+
+    def _count_retry(self):
+        with self._retries_lock:
+            self.retries += 1
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Same as `requests.Session.request`, with the default timeout and retries."""
+        kwargs.setdefault("timeout", self.timeout)
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.exceptions.ConnectionError as e:
+                if attempt == self.max_retries or not self._retryable_error(method, e):
+                    raise
+                self._count_retry()
+                time.sleep(self.backoff(attempt))
+                continue
+
+            if self._retryable_status(method, response.status_code) and attempt < self.max_retries:
+                delay = self.backoff(attempt, response.headers.get("Retry-After"))
+                # Release the connection back to the pool before waiting
+                response.close()
+                self._count_retry()
+                time.sleep(delay)
+                continue
+            return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+_default_transport = None
+_default_lock = threading.Lock()
+
+
+def get_transport() -> HTTPTransport:
+    """Process-wide transport, so every client shares one connection pool per host."""
+    global _default_transport
+    if _default_transport is None:
+        with _default_lock:
+            if _default_transport is None:
+                _default_transport = HTTPTransport()
+    return _default_transport
@@ -0,0 +1 @@
+from model_registry.core import get_or_create, get_embedding, get_reranker, get_llm, loaded_models
@@ -0,0 +1,84 @@
+import threading
+from typing import Callable, Hashable, Literal, Optional, Tuple
+
+# Process-wide instances keyed by (kind, *config)
+_models = {}
+_key_locks = {}
+_lock = threading.Lock()
+
+
+def get_or_create(kind: str, key: Tuple[Hashable, ...], factory: Callable):
+    """
+    Return the shared instance registered under (kind, *key), building it with
+    `factory` on first use.
+
+    Construction holds a lock per key, so concurrent callers asking for the same
+    model wait for a single load while different models can load in parallel.
+    """
+    registry_key = (kind, *key)
+    if registry_key in _models:
+        return _models[registry_key]
+
+    with _lock:
+        key_lock = _key_locks.setdefault(registry_key, threading.Lock())
+    with key_lock:
+        if registry_key not in _models:
+            _models[registry_key] = factory()
+    return _models[registry_key]
+
+
+def loaded_models() -> list:
+    """Registry keys of the models loaded in this process."""
+    return [list(key) for key in _models]
+
+
+def get_embedding(name: str, backend: Literal['torch', 'onnx', 'onnx-int8'] = 'torch',
+                  cache_dir: Optional[str] = None):
+    """
+    Shared embedding model.
+
+    Args:
+        name (str): SentenceTransformer / HuggingFace model name.
+        backend (str): 'torch' (SentenceTransformer), 'onnx' or 'onnx-int8'.
+        cache_dir (str, optional): Wrap the model in a persistent `CachedEmbedding`,
+            keyed on the model's name (which includes the ONNX backend).
+            Wrappers with different cache dirs share the same underlying model.
+    """
+    from embeddings import SentenceTransformerEmbedding, EmbeddingConfig, CachedEmbedding, ONNXEmbedding
+
+    def build():
+        if backend == 'torch':
+            return SentenceTransformerEmbedding(EmbeddingConfig(name=name))
+        if backend in ('onnx', 'onnx-int8'):
+            return ONNXEmbedding(name=name, quantize=backend == 'onnx-int8')
+        raise ValueError(f"Unsupported embedding backend: {backend}")
+
+    model = get_or_create('embedding', (name, backend), build)
+    if cache_dir:
+        model = get_or_create('embedding', (name, backend, cache_dir),
+                              lambda: CachedEmbedding(model, cache_dir=cache_dir))
+    return model
+
+
+def get_reranker(model_name: str, backend: Literal['torch', 'onnx', 'onnx-int8'] = 'torch',
+                 cache_size: int = 8192, cache_ttl: Optional[float] = None):
+    """Shared `Reranker`; callers with the same config also share its score cache."""
+    from re_rank import Reranker
+
+    return get_or_create(
+        'reranker', (model_name, backend, cache_size, cache_ttl),
+        lambda: Reranker(model_name=model_name, cache_size=cache_size, cache_ttl=cache_ttl, backend=backend)
+    )
+
+
+def get_llm(type: str, model_version: str, model_name: str = None, engine: str = None,
+            api_key: str = None, base_url: str = None, **kwargs):
+    """Shared `LLMs` client; arguments are the same as `llms.llms.LLMs`."""
+    from llms.llms import LLMs
+
+    key = (type, model_version, model_name, engine, api_key, base_url, *sorted(kwargs.items()))
+    return get_or_create(
+        'llm', key,
+        lambda: LLMs(type=type, model_version=model_version, model_name=model_name, engine=engine,
+                     api_key=api_key, base_url=base_url, **kwargs)
+    )
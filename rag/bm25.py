@@ -0,0 +1,118 @@
+import os
+import re
+import math
+import pickle
+import unicodedata
+import numpy as np
+from collections import Counter
+from typing import Dict, List, Tuple
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens; model codes such as "s24" or "256gb" stay whole."""
+    return TOKEN_PATTERN.findall(unicodedata.normalize('NFC', text).lower())
+
+
+class BM25Index():
+    """
+    Inverted BM25 index over product documents, keyed by product id.
+
+    Documents can be upserted and removed; the numpy postings used for scoring
+    are rebuilt lazily on the first search after a change.
+    """
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._doc_terms: Dict[str, Dict[str, int]] = {}
+        self._dirty = True
+        self._doc_ids: List[str] = []
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._norms = None
+
+    def __len__(self):
+        return len(self._doc_terms)
+
+    def __contains__(self, _id: str):
+        return _id in self._doc_terms
+
+    def add(self, ids: List[str], documents: List[str]):
+        """Insert or replace documents."""
+        for _id, document in zip(ids, documents):
+            self._doc_terms[_id] = dict(Counter(tokenize(document)))
+        self._dirty = True
+
+    def remove(self, ids: List[str]):
+        for _id in ids:
+            self._doc_terms.pop(_id, None)
+        self._dirty = True
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'wb') as f:
+            pickle.dump({'k1': self.k1, 'b': self.b, 'doc_terms': self._doc_terms}, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path: str) -> 'BM25Index':
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+        index = cls(k1=state['k1'], b=state['b'])
+        index._doc_terms = state['doc_terms']
+        return index
+
+    @classmethod
+    def load_or_create(cls, path: str) -> 'BM25Index':
+        return cls.load(path) if os.path.exists(path) else cls()
+
+    def _build(self):
+        self._doc_ids = list(self._doc_terms)
+        lengths = np.array([sum(terms.values()) for terms in self._doc_terms.values()], dtype=np.float32)
+        avg_length = float(lengths.mean()) if len(lengths) else 0.0
+        # Per-document part of the BM25 denominator
+        self._norms = self.k1 * (1 - self.b + self.b * lengths / max(avg_length, 1e-9))
+
+        postings = {}
+        for doc_idx, terms in enumerate(self._doc_terms.values()):
+            for term, tf in terms.items():
+                postings.setdefault(term, ([], []))
+                postings[term][0].append(doc_idx)
+                postings[term][1].append(tf)
+        self._postings = {
+            term: (np.array(doc_indices, dtype=np.int32), np.array(tfs, dtype=np.float32))
+            for term, (doc_indices, tfs) in postings.items()
+        }
+        self._dirty = False
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[str, float]]:
+        """Return up to `limit` (id, bm25 score) pairs, best first."""
+        if self._dirty:
+            self._build()
+        n_docs = len(self._doc_ids)
+        if n_docs == 0:
+            return []
+
+        scores = np.zeros(n_docs, dtype=np.float32)
+        for term in set(tokenize(query)):
+            if term not in self._postings:
+                continue
+            doc_indices, tfs = self._postings[term]
+            idf = math.log(1 + (n_docs - len(doc_indices) + 0.5) / (len(doc_indices) + 0.5))
+            scores[doc_indices] += idf * tfs * (self.k1 + 1) / (tfs + self._norms[doc_indices])
+
+        matched = np.flatnonzero(scores)
+        if len(matched) == 0:
+            return []
+        limit = min(limit, len(matched))
+        top = matched[np.argpartition(-scores[matched], limit - 1)[:limit]]
+        top = top[np.argsort(-scores[top])]
+        return [(self._doc_ids[i], float(scores[i])) for i in top]
+
+
+def reciprocal_rank_fusion(ranked_lists: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Fuse ranked id lists with RRF: score(id) = sum(1 / (k + rank))."""
+    scores = {}
+    for ranked_ids in ranked_lists:
+        for rank, _id in enumerate(ranked_ids, start=1):
+            scores[_id] = scores.get(_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda x: x[1], reverse=True)
@@ -1,4 +1,7 @@
+import os
 import pymongo
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 try:
     import google.generativeai as genai
     from IPython.display import Markdown
@@ -6,8 +9,15 @@ try:
 except ImportError:
     # LLM dependencies not required for search-only mode
     pass
-from embeddings import SentenceTransformerEmbedding, EmbeddingConfig
-from typing import Optional, Literal
+from model_registry import get_embedding
+from embeddings.cache import normalize_text
+from rag.cache import LRUCache
+from rag.query import QueryContext
+from rag.faiss_store import FaissVectorStore
+from rag.bm25 import BM25Index, reciprocal_rank_fusion
+from rag.filters import to_chroma_where, to_mongodb_filter, to_qdrant_filter
+from insert_data.build_chromadb import read_ingest_marker
+from typing import Optional, Literal, List, Union, Dict
 from qdrant_client import QdrantClient, models
 from qdrant_client.http.models import Distance, VectorParams
 from qdrant_client import models, QdrantClient
@@ -16,13 +26,21 @@ import chromadb
 class RAG():
     def __init__(self, 
             llm,
-            type: Literal['chromadb','mongodb', 'qdrant'],
+            type: Literal['chromadb','mongodb', 'qdrant', 'faiss'],
             mongodbUri: Optional[str] = None,
             qdrant_api: Optional[str] = None,
             qdrant_url: Optional[str] = None,
             dbName: Optional[str] = None,
             dbCollection: Optional[str] = None,
             embeddingName: str ='Alibaba-NLP/gte-multilingual-base',
+            embeddingCacheDir: Optional[str] = None,
+            embeddingBackend: Literal['torch', 'onnx', 'onnx-int8'] = 'torch',
+            queryCacheSize: int = 1024,
+            queryCacheTtl: Optional[float] = None,
+            faissIndexDir: str = './faiss_index',
+            faissIndexType: Literal['flat', 'hnsw', 'ivf'] = 'flat',
+            faissNprobe: int = 16,
+            bm25Path: Optional[str] = None,
         ):
         self.type = type
         if self.type == 'mongodb':
@@ -37,6 +55,28 @@ class RAG():
                             url=self.qdrant_url,
                             api_key=self.qdrant_api
                             )
+        elif self.type == 'faiss':
+            collection_name = embeddingName.split('/')[-1]
+            self.faiss_store = FaissVectorStore(
+                index_dir=os.path.join(faissIndexDir, collection_name),
+                index_type=faissIndexType,
+                nprobe=faissNprobe
+            )
+            # The chromadb collection written by insert_data is the source of truth
+            chromadb_client = chromadb.PersistentClient(path="./chroma_db")
+            chromadb_collection = chromadb_client.get_collection(name=collection_name)
+            # Row count plus the stamp insert_data writes after every ingest, no collection scan
+            marker = read_ingest_marker("./chroma_db", embeddingName) or {}
+            fingerprint = f"{chromadb_collection.count()}@{marker.get('ingested_at', '')}"
+            # Workers sharing the store wait here while one of them (re)builds it
+            with self.faiss_store.build_lock():
+                if self.faiss_store.source_fingerprint() == fingerprint:
+                    self.faiss_store.load()
+                else:
+                    if self.faiss_store.exists():
+                        print(f"⚠️ chromadb collection `{collection_name}` changed since the vector store was built, rebuilding...")
+                    print(f"Building {faissIndexType} vector store from chromadb collection `{collection_name}`...")
+                    self.faiss_store.build_from_chromadb(chromadb_collection, source=fingerprint)
         else:
             self.type = 'chromadb'
             self.client = chromadb.PersistentClient(path="./chroma_db")
@@ -45,17 +85,32 @@ class RAG():
                 self.chromadb_collection = self.client.get_collection(name=self.chromadb_collection_name)
 
 
-        self.embedding_model = SentenceTransformerEmbedding(
-            EmbeddingConfig(name=embeddingName)
-        )
+        # Shared with the semantic router and ingestion through the model registry
+        self.embedding_model = get_embedding(embeddingName, backend=embeddingBackend, cache_dir=embeddingCacheDir)
+        self.query_cache = LRUCache(maxsize=queryCacheSize, ttl=queryCacheTtl)
         self.llm = llm
 
+        # BM25 index written by insert_data next to the chromadb collection
+        if bm25Path is None:
+            bm25Path = os.path.join("./chroma_db", f"bm25_{embeddingName.split('/')[-1]}.pkl")
+        self.bm25 = BM25Index.load(bm25Path) if os.path.exists(bm25Path) else None
+        # Runs the vector retriever next to BM25 in hybrid search
+        self._retriever_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="hybrid") if self.bm25 else None
+
     def get_embedding(self, text):
         if not text.strip():
             return []
 
-        embedding = self.embedding_model.encode(text)
-        return embedding.tolist()
+        key = normalize_text(text)
+        embedding = self.query_cache.get(key)
+        if embedding is None:
+            embedding = self.embedding_model.encode(text).tolist()
+            self.query_cache.put(key, embedding)
+        return embedding
+
+    def cache_stats(self) -> dict:
+        """Hit/miss/eviction counters of the query embedding cache."""
+        return self.query_cache.stats()
 
     def _collection_exists(self):           
         """
@@ -74,97 +129,344 @@ class RAG():
                 return True
             except ValueError:
                 return False
+    def build_query_context(self, user_query: str) -> QueryContext:
+        """Wrap a query so its embedding is computed once and shared by every stage."""
+        return QueryContext(user_query, self.get_embedding, model_name=self.embedding_model.name)
+
     def vector_search(
             self, 
-            user_query: str, 
-            limit=4):
+            user_query: Union[str, QueryContext], 
+            limit=4,
+            filters: Optional[Dict] = None):
         """
         Perform a vector search in the MongoDB collection or Qdrant collection based on the user query.
 
         Args:
-        user_query (str): The user's query string.
+        user_query (str | QueryContext): The user's query string, or a query context
+            whose embedding was already computed by an earlier stage.
+        filters (dict, optional): Metadata filter (see rag.filters), pushed down
+            to the vector store, e.g. {"brand": "samsung", "price": {"$lte": 10000000}}.
 
         Returns:
         list: A list of matching documents.
         """
+        if not isinstance(user_query, QueryContext):
+            user_query = self.build_query_context(user_query)
 
         # Generate embedding for the user query
-        query_embedding = self.get_embedding(user_query)
+        query_embedding = user_query.embedding
 
         if query_embedding is None:
             return "Invalid query or embedding generation failed."
 
+        return self.vector_search_by_vector(query_embedding, limit=limit, filters=filters)
+
+    def vector_search_by_vector(
+            self,
+            query_embedding: List[float],
+            limit=4,
+            filters: Optional[Dict] = None):
+        """
+        Perform a vector search with an already computed query embedding.
+
+        Args:
+        query_embedding (list): The query embedding.
+        filters (dict, optional): Metadata filter (see rag.filters).
+
+        Returns:
+        list: A list of matching documents.
+        """
+        if not isinstance(query_embedding, list):
+            query_embedding = list(map(float, query_embedding))
+
         # Define the vector search pipeline
         if self.type == 'qdrant':
             if self._collection_exists:
                 hits = self.client.search(
                     collection_name=self.qdrant_collection,
-                    query_vector=self.embedding_model.encode(user_query).tolist(),
+                    query_vector=query_embedding,
+                    query_filter=to_qdrant_filter(filters),
                     limit=limit
                 )               
-                results = []
-                for hit in hits:
-                    results.append({'_id': hit.payload['_id'], 'combined_information': hit.payload['combined_information'], 'score': hit.score})
-                return results
+                return self._format_qdrant_hits(hits)
             else: 
                 print(f"Collection {self.qdrant_collection} does not exist")
                 return
         elif self.type == 'mongodb':
-            vector_search_stage = {
-                "$vectorSearch": {
-                    "index": "vector_index",
-                    "queryVector": query_embedding,
-                    "path": "embedding",
-                    "numCandidates": 400,
-                    "limit": limit,
-                }
-            }
-
-            unset_stage = {
-                "$unset": "embedding" 
-            }
-
-            project_stage = {
-                "$project": {
-                    "_id": 1,  
-                    "title": 1, 
-                    # "product_specs": 1,
-                    "color_options": 1,
-                    "current_price": 1,
-                    "product_promotion": 1,
-                    "score": {
-                        "$meta": "vectorSearchScore"
-                    }
-                }
-            }
-
-            pipeline = [vector_search_stage, unset_stage, project_stage]
+            pipeline = self._mongodb_pipeline(query_embedding, limit, filters)
 
             # Execute the search
             results = self.collection.aggregate(pipeline)
     
             return list(results)
 
+        elif self.type == 'faiss':
+            return self.faiss_store.search([query_embedding], limit=limit, filters=filters)[0]
+
         else:
-            query_vector = self.embedding_model.encode(user_query).tolist()
-    
             hits = self.chromadb_collection.query(
-                query_embeddings=[query_vector],
-                n_results=limit
+                query_embeddings=[query_embedding],
+                n_results=limit,
+                where=to_chroma_where(filters)
             )
-                
-            results = []
-            for i in range(len(hits['ids'][0])):
-                distance = hits['distances'][0][i]
-                simlarity = 1 - distance 
-
-                result = {
-                    "_id": hits['ids'][0][i],
-                    "combined_information": hits['documents'][0][i],
-                    "score": simlarity
+            return self._format_chromadb_hits(hits, 0)
+
+    def hybrid_search(
+            self,
+            user_query: Union[str, QueryContext],
+            limit=4,
+            candidates: Optional[int] = None,
+            rrf_k: int = 60,
+            filters: Optional[Dict] = None):
+        """
+        Perform a BM25 + vector search and fuse both rankings with reciprocal-rank fusion.
+
+        Exact tokens such as model codes ("S24 Ultra", "256GB") are matched by BM25,
+        meaning ones by the vector search.
+
+        Args:
+        user_query (str | QueryContext): The user's query.
+        limit (int): Number of fused results.
+        candidates (int, optional): Results taken from each retriever before fusion.
+        rrf_k (int): RRF constant.
+        filters (dict, optional): Metadata filter applied to both retrievers.
+
+        Returns:
+        list: A list of matching documents in fused order, `score` being the cosine
+            similarity to the query (as in `vector_search`), `rrf_score` the fused
+            score and `bm25_score` the BM25 score (None when BM25 missed it).
+        """
+        if self.type not in ('chromadb', 'faiss'):
+            raise ValueError(f"Hybrid search is not supported for {self.type}")
+        if not isinstance(user_query, QueryContext):
+            user_query = self.build_query_context(user_query)
+        if self.bm25 is None:
+            print("BM25 index not found, falling back to vector search")
+            return self.vector_search(user_query, limit=limit, filters=filters)
+
+        candidates = candidates or max(limit * 2, 20)
+        # The query embedding and vector search overlap with the BM25 scoring
+        vector_future = self._retriever_pool.submit(self.vector_search, user_query, limit=candidates, filters=filters)
+        bm25_hits = dict(self.bm25.search(user_query.text, limit=candidates))
+        if filters:
+            allowed = set(self._filter_ids(list(bm25_hits), filters))
+            bm25_hits = {_id: score for _id, score in bm25_hits.items() if _id in allowed}
+        vector_hits = {hit['_id']: hit for hit in vector_future.result()}
+
+        fused = reciprocal_rank_fusion([list(vector_hits), list(bm25_hits)], k=rrf_k)[:limit]
+
+        # Documents only found by BM25 are fetched, and scored, from the vector store
+        records = self._fetch_records([_id for _id, _ in fused if _id not in vector_hits], user_query.vector)
+
+        results = []
+        for _id, rrf_score in fused:
+            record = vector_hits.get(_id) or records.get(_id)
+            if record is None:
+                continue
+            results.append({
+                "_id": _id,
+                "combined_information": record['combined_information'],
+                "score": record['score'],
+                "rrf_score": rrf_score,
+                "bm25_score": bm25_hits.get(_id)
+            })
+        return results
+
+    def _filter_ids(self, ids: List[str], filters: Dict) -> List[str]:
+        if not ids:
+            return []
+        if self.type == 'faiss':
+            return self.faiss_store.filter_ids(ids, filters)
+        return self.chromadb_collection.get(ids=ids, where=to_chroma_where(filters), include=[])['ids']
+
+    def _fetch_records(self, ids: List[str], query_vector: np.ndarray) -> dict:
+        """Return {id: {"combined_information", "score"}}, `score` being the cosine similarity to the query."""
+        if not ids:
+            return {}
+        if self.type == 'faiss':
+            return self.faiss_store.get_records(ids, query_vector)
+        hits = self.chromadb_collection.get(ids=ids, include=['documents', 'embeddings'])
+        if len(hits['ids']) == 0:
+            return {}
+        vectors = np.asarray(hits['embeddings'], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1) * max(np.linalg.norm(query_vector), 1e-12)
+        scores = vectors @ query_vector / np.maximum(norms, 1e-12)
+        return {
+            _id: {"combined_information": document, "score": float(score)}
+            for _id, document, score in zip(hits['ids'], hits['documents'], scores)
+        }
+
+    def get_embeddings(self, texts: List[str], batch_size: int = 64) -> List[List[float]]:
+        """
+        Embed many queries, encoding the ones missing from the query cache in batches.
+
+        Args:
+        texts (list): The query strings.
+        batch_size (int): Number of texts per `encode` call.
+
+        Returns:
+        list: One embedding (list of floats) per text, [] for blank texts.
+        """
+        embeddings = [None] * len(texts)
+        missing = []
+        for i, text in enumerate(texts):
+            if not text.strip():
+                embeddings[i] = []
+                continue
+            embeddings[i] = self.query_cache.get(normalize_text(text))
+            if embeddings[i] is None:
+                missing.append(i)
+
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size]
+            vectors = self.embedding_model.encode([texts[i] for i in batch])
+            for i, vector in zip(batch, vectors):
+                embeddings[i] = [float(x) for x in vector]
+                self.query_cache.put(normalize_text(texts[i]), embeddings[i])
+        return embeddings
+
+    def vector_search_many(
+            self,
+            queries: List[str],
+            limit=4,
+            batch_size: int = 64,
+            filters: Optional[Dict] = None):
+        """
+        Perform vector searches for many queries at once.
+
+        Queries are embedded in batches and sent to the vector store as
+        multi-vector queries where the backend supports it.
+
+        Args:
+        queries (list): The query strings.
+        limit (int): Number of results per query.
+        batch_size (int): Number of queries per encode / store call.
+        filters (dict, optional): Metadata filter applied to every query.
+
+        Returns:
+        list: One list of matching documents per query.
+        """
+        embeddings = self.get_embeddings(queries, batch_size=batch_size)
+        results = [[] for _ in queries]
+
+        # Blank queries have no embedding and no results
+        indices = [i for i, embedding in enumerate(embeddings) if embedding]
+        vectors = [embeddings[i] for i in indices]
+        for i, hits in zip(indices, self.vector_search_many_by_vectors(vectors, limit=limit, batch_size=batch_size, filters=filters)):
+            results[i] = hits
+        return results
+
+    def vector_search_many_by_vectors(
+            self,
+            query_embeddings: List[List[float]],
+            limit=4,
+            batch_size: int = 64,
+            filters: Optional[Dict] = None):
+        """
+        Perform vector searches for many already computed query embeddings.
+
+        Returns:
+        list: One list of matching documents per embedding.
+        """
+        query_embeddings = [
+            embedding if isinstance(embedding, list) else list(map(float, embedding))
+            for embedding in query_embeddings
+        ]
+        results = []
+
+        for start in range(0, len(query_embeddings), batch_size):
+            batch = query_embeddings[start:start + batch_size]
+
+            if self.type == 'qdrant':
+                responses = self.client.search_batch(
+                    collection_name=self.qdrant_collection,
+                    requests=[
+                        models.SearchRequest(vector=embedding, limit=limit, filter=to_qdrant_filter(filters), with_payload=True)
+                        for embedding in batch
+                    ]
+                )
+                results.extend(self._format_qdrant_hits(hits) for hits in responses)
+            elif self.type == 'mongodb':
+                # $vectorSearch takes a single query vector per pipeline
+                results.extend(
+                    list(self.collection.aggregate(self._mongodb_pipeline(embedding, limit, filters)))
+                    for embedding in batch
+                )
+            elif self.type == 'faiss':
+                results.extend(self.faiss_store.search(batch, limit=limit, filters=filters))
+            else:
+                hits = self.chromadb_collection.query(
+                    query_embeddings=batch,
+                    n_results=limit,
+                    where=to_chroma_where(filters)
+                )
+                results.extend(self._format_chromadb_hits(hits, row) for row in range(len(batch)))
+
+        return results
+
+    def _mongodb_pipeline(self, query_embedding: List[float], limit: int, filters: Optional[Dict] = None) -> list:
+        vector_search_stage = {
+            "$vectorSearch": {
+                "index": "vector_index",
+                "queryVector": query_embedding,
+                "path": "embedding",
+                "numCandidates": 400,
+                "limit": limit,
+            }
+        }
+        if filters:
+            vector_search_stage["$vectorSearch"]["filter"] = to_mongodb_filter(filters)
+
+        unset_stage = {
+            "$unset": "embedding" 
+        }
+
+        project_stage = {
+            "$project": {
+                "_id": 1,  
+                "title": 1, 
+                # "product_specs": 1,
+                "color_options": 1,
+                "current_price": 1,
+                "product_promotion": 1,
+                "score": {
+                    "$meta": "vectorSearchScore"
                 }
-                results.append(result)
-            return results
+            }
+        }
+
+        return [vector_search_stage, unset_stage, project_stage]
+
+    def _format_qdrant_hits(self, hits) -> list:
+        results = []
+        for hit in hits:
+            results.append({'_id': hit.payload['_id'], 'combined_information': hit.payload['combined_information'], 'score': hit.score})
+        return results
+
+    def _chromadb_similarity(self, distance: float) -> float:
+        """
+        Cosine similarity from a Chroma distance, so scores are comparable across stores.
+        Collections use the default squared L2 space unless created with another `hnsw:space`;
+        the embeddings are normalized, so cos = 1 - d / 2.
+        """
+        space = (self.chromadb_collection.metadata or {}).get('hnsw:space', 'l2')
+        if space == 'l2':
+            return 1 - distance / 2
+        # cosine: d = 1 - cos, ip: d = 1 - dot
+        return 1 - distance
+
+    def _format_chromadb_hits(self, hits, row: int) -> list:
+        results = []
+        for i in range(len(hits['ids'][row])):
+            simlarity = self._chromadb_similarity(hits['distances'][row][i])
+
+            result = {
+                "_id": hits['ids'][row][i],
+                "combined_information": hits['documents'][row][i],
+                "score": simlarity
+            }
+            results.append(result)
+        return results
 
     # def enhance_prompt(self, query):
     #     get_knowledge = self.vector_search(query, 10)
@@ -202,6 +504,9 @@ class RAG():
     def generate_content(self, prompt):
         return self.llm.generate_content(prompt)
 
+    def stream_content(self, prompt):
+        return self.llm.stream_content(prompt)
+
     def _to_markdown(text):
         text = text.replace('•', '  *')
         return Markdown(textwrap.indent(text, '> ', predicate=lambda _: True))
@@ -0,0 +1,321 @@
+import os
+import json
+import shutil
+import tempfile
+import contextlib
+import numpy as np
+from typing import Dict, Iterable, List, Optional, Tuple
+from rag.filters import filter_mask
+
+try:
+    import faiss
+except ImportError:
+    # faiss-cpu is optional, the exact numpy search is used without it
+    faiss = None
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: builds are only serialized within one process
+    fcntl = None
+
+INDEX_TYPES = ('flat', 'hnsw', 'ivf')
+
+
+class StringTable():
+    """Strings stored as one utf-8 blob plus an offsets array, both memory-mapped."""
+
+    def __init__(self, path: str, name: str):
+        self.blob_path = os.path.join(path, f"{name}.bin")
+        self.offsets_path = os.path.join(path, f"{name}.offsets.npy")
+        self._blob = None
+        self._offsets = None
+
+    def write(self, values: Iterable[str]):
+        offsets = [0]
+        with open(self.blob_path, 'wb') as f:
+            for value in values:
+                data = value.encode('utf-8')
+                f.write(data)
+                offsets.append(offsets[-1] + len(data))
+        np.save(self.offsets_path, np.asarray(offsets, dtype=np.int64))
+
+    def load(self):
+        self._offsets = np.load(self.offsets_path, mmap_mode='r')
+        if os.path.getsize(self.blob_path) > 0:
+            self._blob = np.memmap(self.blob_path, dtype=np.uint8, mode='r')
+        return self
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        if start == end:
+            return ''
+        return self._blob[start:end].tobytes().decode('utf-8')
+
+
+class FaissVectorStore():
+    """
+    In-process vector store for catalogs that fit in RAM.
+
+    Normalized float32 vectors are kept in a memory-mapped file (`vectors.f32`),
+    so every worker process that opens the same directory shares one copy of the
+    pages. Searches use an exact numpy inner product (`flat`), or a FAISS HNSW /
+    IVF index when faiss is installed. Scores are cosine similarities.
+
+    A store is built in a staging directory and moved into place, so workers
+    that already memory-map the previous files keep reading them; callers check,
+    build and load under `build_lock` so concurrent workers build it only once.
+    """
+    def __init__(self, index_dir: str, index_type: str = 'flat', nprobe: int = 16):
+        """
+        Args:
+            index_dir (str): Directory of the store files.
+            index_type (str): 'flat' (exact numpy search), 'hnsw' or 'ivf'.
+            nprobe (int): Number of IVF cells visited per query (index_type='ivf'),
+                trading recall for latency.
+        """
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unsupported index type: {index_type}")
+        if index_type != 'flat' and faiss is None:
+            print(f"⚠️ faiss is not installed, falling back to exact search instead of '{index_type}'")
+            index_type = 'flat'
+
+        self.index_dir = index_dir
+        self.index_type = index_type
+        self.nprobe = nprobe
+        self.vectors = None
+        self.index = None
+        self.ids = StringTable(index_dir, 'ids')
+        self.documents = StringTable(index_dir, 'documents')
+        self.metadatas = StringTable(index_dir, 'metadatas')
+        self._id_to_row = None
+        self._columns = {}
+
+        self._meta_path = os.path.join(index_dir, 'meta.json')
+        self._vectors_path = os.path.join(index_dir, 'vectors.f32')
+        self._faiss_path = os.path.join(index_dir, f"index_{index_type}.faiss")
+
+    def exists(self) -> bool:
+        return os.path.exists(self._meta_path)
+
+    def source_fingerprint(self) -> Optional[str]:
+        """Fingerprint of the source data the store was built from, if recorded."""
+        if not self.exists():
+            return None
+        with open(self._meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('source')
+
+    @contextlib.contextmanager
+    def build_lock(self):
+        """Exclusive lock of the store, shared by every process opening the same directory."""
+        index_dir = os.path.abspath(self.index_dir)
+        os.makedirs(os.path.dirname(index_dir), exist_ok=True)
+        # Next to the directory, which is replaced on every build
+        with open(f"{index_dir}.lock", 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def build(self, batches: Iterable[Tuple[List[str], List[str], List[List[float]], List[dict]]],
+              nlist: int = 1024, hnsw_m: int = 32, source: Optional[str] = None):
+        """
+        Write the store from batches of (ids, documents, embeddings, metadatas).
+
+        Args:
+            batches (Iterable): Record batches, e.g. pages exported from Chroma.
+            nlist (int): Number of IVF cells (index_type='ivf').
+            hnsw_m (int): Number of HNSW neighbours per node (index_type='hnsw').
+            source (str, optional): Fingerprint of the source data, see `source_fingerprint`.
+        """
+        index_dir = os.path.abspath(self.index_dir)
+        os.makedirs(os.path.dirname(index_dir), exist_ok=True)
+        staging_dir = tempfile.mkdtemp(prefix=f".{os.path.basename(index_dir)}-", dir=os.path.dirname(index_dir))
+        try:
+            size = FaissVectorStore(staging_dir, self.index_type)._write(batches, nlist, hnsw_m, source)
+            # Rename, never truncate: other workers may have the current files memory-mapped
+            old_dir = f"{staging_dir}.old"
+            if os.path.exists(index_dir):
+                os.replace(index_dir, old_dir)
+            os.replace(staging_dir, index_dir)
+        except BaseException:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+        print(f"✅ Built {self.index_type} vector store with {size} vectors at {self.index_dir}")
+        return self.load()
+
+    def _write(self, batches, nlist: int, hnsw_m: int, source: Optional[str]) -> int:
+        """Write every file of the store into `index_dir`, meta.json last."""
+        ids, documents, metadatas = [], [], []
+        size, dim = 0, None
+
+        with open(self._vectors_path, 'wb') as f:
+            for batch_ids, batch_documents, batch_embeddings, batch_metadatas in batches:
+                vectors = np.asarray(batch_embeddings, dtype=np.float32)
+                if len(vectors) == 0:
+                    continue
+                dim = vectors.shape[1]
+                vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+                f.write(vectors.tobytes())
+
+                ids.extend(batch_ids)
+                documents.extend(batch_documents)
+                metadatas.extend(json.dumps(metadata or {}, ensure_ascii=False) for metadata in batch_metadatas)
+                size += len(vectors)
+
+        self.ids.write(ids)
+        self.documents.write(documents)
+        self.metadatas.write(metadatas)
+
+        if self.index_type != 'flat' and size > 0:
+            vectors = np.memmap(self._vectors_path, dtype=np.float32, mode='r', shape=(size, dim))
+            if self.index_type == 'hnsw':
+                index = faiss.IndexHNSWFlat(dim, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+            else:
+                quantizer = faiss.IndexFlatIP(dim)
+                index = faiss.IndexIVFFlat(quantizer, dim, min(nlist, size), faiss.METRIC_INNER_PRODUCT)
+                index.train(np.ascontiguousarray(vectors[:min(size, 256 * nlist)]))
+            index.add(np.ascontiguousarray(vectors))
+            faiss.write_index(index, self._faiss_path)
+
+        # Written last, so a crash mid-build never leaves a store that looks complete
+        with open(self._meta_path, 'w', encoding='utf-8') as f:
+            json.dump({'size': size, 'dim': dim, 'source': source}, f)
+        return size
+
+    def build_from_chromadb(self, collection, page_size: int = 5000, source: Optional[str] = None, **kwargs):
+        """Export every record of a Chroma collection into the store."""
+        def pages():
+            offset = 0
+            while True:
+                page = collection.get(
+                    include=['embeddings', 'documents', 'metadatas'],
+                    limit=page_size,
+                    offset=offset
+                )
+                if len(page['ids']) == 0:
+                    return
+                yield page['ids'], page['documents'], page['embeddings'], page['metadatas']
+                offset += page_size
+
+        return self.build(pages(), source=source, **kwargs)
+
+    def load(self):
+        with open(self._meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        self.vectors = None
+        self.index = None
+        self._id_to_row = None
+        self._columns = {}
+        self.ids.load()
+        self.documents.load()
+        self.metadatas.load()
+
+        if meta['size'] > 0:
+            self.vectors = np.memmap(self._vectors_path, dtype=np.float32, mode='r', shape=(meta['size'], meta['dim']))
+
+        if self.index_type != 'flat' and self.vectors is not None:
+            if not os.path.exists(self._faiss_path):
+                raise FileNotFoundError(f"FAISS index not found at {self._faiss_path}, please rebuild the store")
+            try:
+                self.index = faiss.read_index(self._faiss_path, faiss.IO_FLAG_MMAP)
+            except RuntimeError:
+                # Not every index type supports memory-mapped loading
+                self.index = faiss.read_index(self._faiss_path)
+            if self.index_type == 'ivf':
+                faiss.extract_index_ivf(self.index).nprobe = self.nprobe
+        return self
+
+    def __len__(self):
+        return 0 if self.vectors is None else len(self.vectors)
+
+    def search(self, query_embeddings: List[List[float]], limit: int = 4,
+               filters: Optional[Dict] = None) -> List[List[dict]]:
+        """
+        Search the nearest records of every query embedding.
+
+        With `filters` (see rag.filters), only the matching rows are scored,
+        with an exact search.
+
+        Returns:
+            list: One list of {"_id", "combined_information", "score"} per query.
+        """
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries.reshape(1, -1)
+        if len(self) == 0 or len(queries) == 0:
+            return [[] for _ in range(len(queries))]
+
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+
+        if filters:
+            rows = np.flatnonzero(filter_mask(self._column, filters, len(self)))
+            if len(rows) == 0:
+                return [[] for _ in range(len(queries))]
+            scores, indices = self._exact_search(queries, min(limit, len(rows)), rows)
+            indices = rows[indices]
+        elif self.index is not None:
+            scores, indices = self.index.search(queries, min(limit, len(self)))
+        else:
+            scores, indices = self._exact_search(queries, min(limit, len(self)))
+
+        return [
+            [self._record(int(i), float(score)) for i, score in zip(row_indices, row_scores) if i >= 0]
+            for row_indices, row_scores in zip(indices, scores)
+        ]
+
+    def _exact_search(self, queries: np.ndarray, limit: int, rows: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        vectors = self.vectors if rows is None else self.vectors[rows]
+        scores = queries @ vectors.T
+        top = np.argpartition(-scores, limit - 1, axis=1)[:, :limit]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        return np.take_along_axis(top_scores, order, axis=1), np.take_along_axis(top, order, axis=1)
+
+    def _record(self, i: int, score: float) -> dict:
+        return {
+            "_id": self.ids[i],
+            "combined_information": self.documents[i],
+            "score": score
+        }
+
+    def get_metadata(self, i: int) -> dict:
+        return json.loads(self.metadatas[i])
+
+    def _column(self, field: str) -> np.ndarray:
+        """Values of one metadata field for every row, parsed once and kept in memory."""
+        if field not in self._columns:
+            self._columns[field] = np.array(
+                [self.get_metadata(i).get(field) for i in range(len(self))], dtype=object
+            )
+        return self._columns[field]
+
+    def filter_ids(self, ids: List[str], filters: Optional[Dict]) -> List[str]:
+        """Keep the ids whose metadata matches `filters`."""
+        if not filters:
+            return list(ids)
+        if self._id_to_row is None:
+            self._id_to_row = {self.ids[i]: i for i in range(len(self.ids))}
+        mask = filter_mask(self._column, filters, len(self))
+        return [_id for _id in ids if _id in self._id_to_row and mask[self._id_to_row[_id]]]
+
+    def get_records(self, ids: List[str], query_embedding: List[float]) -> dict:
+        """Return {id: {"combined_information", "score"}} for the given ids, scored against one query."""
+        if self._id_to_row is None:
+            self._id_to_row = {self.ids[i]: i for i in range(len(self.ids))}
+        ids = [_id for _id in ids if _id in self._id_to_row]
+        if not ids:
+            return {}
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / max(np.linalg.norm(query), 1e-12)
+        rows = np.array([self._id_to_row[_id] for _id in ids])
+        scores = self.vectors[rows] @ query
+        return {_id: self._record(int(row), float(score)) for _id, row, score in zip(ids, rows, scores)}
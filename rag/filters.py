@@ -0,0 +1,202 @@
+"""
+Metadata filter expressions for `RAG.vector_search`.
+
+A filter is a dict of field -> value or field -> {operator: value}, all fields
+being combined with AND, e.g.
+
+    {"brand": "samsung", "price": {"$lte": 10000000}, "ram_gb": {"$gte": 8}}
+
+Supported operators: $eq, $ne, $gt, $gte, $lt, $lte, $in, $nin. Fields are the
+typed metadata written at ingestion (price, brand, ram_gb, storage_gb).
+"""
+import re
+import numpy as np
+from typing import Callable, Dict, Optional
+from qdrant_client import models
+from insert_data.metadata import parse_brand
+
+OPERATORS = ('$eq', '$ne', '$gt', '$gte', '$lt', '$lte', '$in', '$nin')
+RANGE_OPERATORS = {'$gt': 'gt', '$gte': 'gte', '$lt': 'lt', '$lte': 'lte'}
+
+
+def normalize_filters(filters: Optional[Dict]) -> list:
+    """Return the filter as a list of (field, operator, value) conditions."""
+    conditions = []
+    for field, condition in (filters or {}).items():
+        if not isinstance(condition, dict):
+            condition = {'$eq': condition}
+        for operator, value in condition.items():
+            if operator not in OPERATORS:
+                raise ValueError(f"Unsupported filter operator: {operator}")
+            conditions.append((field, operator, value))
+    return conditions
+
+
+def _and(clauses: list) -> Optional[dict]:
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def to_chroma_where(filters: Optional[Dict]) -> Optional[dict]:
+    """Filter as a Chroma `where` clause."""
+    return _and([{field: {operator: value}} for field, operator, value in normalize_filters(filters)])
+
+
+def to_mongodb_filter(filters: Optional[Dict]) -> Optional[dict]:
+    """
+    Filter as a MongoDB `$vectorSearch` filter. The fields must be declared as
+    `filter` fields of the Atlas vector index.
+    """
+    return _and([{field: {operator: value}} for field, operator, value in normalize_filters(filters)])
+
+
+def to_qdrant_filter(filters: Optional[Dict]) -> Optional[models.Filter]:
+    """Filter as a Qdrant payload filter."""
+    must, must_not = [], []
+    ranges = {}
+    for field, operator, value in normalize_filters(filters):
+        if operator in RANGE_OPERATORS:
+            ranges.setdefault(field, {})[RANGE_OPERATORS[operator]] = value
+        elif operator == '$eq':
+            must.append(models.FieldCondition(key=field, match=models.MatchValue(value=value)))
+        elif operator == '$ne':
+            must_not.append(models.FieldCondition(key=field, match=models.MatchValue(value=value)))
+        elif operator == '$in':
+            must.append(models.FieldCondition(key=field, match=models.MatchAny(any=list(value))))
+        else:
+            must_not.append(models.FieldCondition(key=field, match=models.MatchAny(any=list(value))))
+
+    for field, bounds in ranges.items():
+        must.append(models.FieldCondition(key=field, range=models.Range(**bounds)))
+
+    if not must and not must_not:
+        return None
+    return models.Filter(must=must or None, must_not=must_not or None)
+
+
+def matches(metadata: dict, filters: Optional[Dict]) -> bool:
+    """Evaluate a filter against one metadata dict."""
+    for field, operator, value in normalize_filters(filters):
+        actual = metadata.get(field)
+        if operator == '$eq':
+            ok = actual == value
+        elif operator == '$ne':
+            ok = actual != value
+        elif operator == '$in':
+            ok = actual in value
+        elif operator == '$nin':
+            ok = actual not in value
+        elif actual is None:
+            ok = False
+        elif operator == '$gt':
+            ok = actual > value
+        elif operator == '$gte':
+            ok = actual >= value
+        elif operator == '$lt':
+            ok = actual < value
+        else:
+            ok = actual <= value
+        if not ok:
+            return False
+    return True
+
+
+def filter_mask(get_column: Callable[[str], np.ndarray], filters: Optional[Dict], size: int) -> np.ndarray:
+    """
+    Evaluate a filter over columns of metadata values at once.
+
+    Args:
+        get_column (Callable): Returns the object array of a field's values
+            (None where the field is missing).
+        size (int): Number of rows.
+
+    Returns:
+        np.ndarray: Boolean mask of the rows that match.
+    """
+    mask = np.ones(size, dtype=bool)
+    for field, operator, value in normalize_filters(filters):
+        column = get_column(field)
+        if operator == '$eq':
+            mask &= column == value
+        elif operator == '$ne':
+            mask &= column != value
+        elif operator == '$in':
+            mask &= np.isin(column, list(value))
+        elif operator == '$nin':
+            mask &= ~np.isin(column, list(value))
+        else:
+            numbers = np.array([np.nan if x is None else x for x in column], dtype=np.float64)
+            with np.errstate(invalid='ignore'):
+                if operator == '$gt':
+                    mask &= numbers > value
+                elif operator == '$gte':
+                    mask &= numbers >= value
+                elif operator == '$lt':
+                    mask &= numbers < value
+                else:
+                    mask &= numbers <= value
+    return mask
+
+
+PRICE_UNITS = {'triệu': 1_000_000, 'tr': 1_000_000, 'củ': 1_000_000, 'nghìn': 1_000, 'k': 1_000}
+PRICE_UNIT = r'(triệu|tr|củ|nghìn|k)\b'
+PRICE_NUMBER = rf'(\d+(?:[.,]\d+)?)\s*{PRICE_UNIT}'
+PRICE_BETWEEN = re.compile(rf'(?:từ|khoảng)\s*(\d+(?:[.,]\d+)?)\s*(?:{PRICE_UNIT})?\s*(?:đến|-|tới)\s*{PRICE_NUMBER}')
+PRICE_BELOW = re.compile(rf'(?:dưới|không quá|tối đa|nhỏ hơn|rẻ hơn|thấp hơn)\s*{PRICE_NUMBER}')
+# "hơn" alone means "more than", but is also the end of "rẻ hơn" / "nhỏ hơn" (less than)
+PRICE_ABOVE = re.compile(rf'(?:trên|(?<!rẻ )(?<!nhỏ )(?<!thấp )hơn|từ|tối thiểu|lớn hơn)\s*{PRICE_NUMBER}')
+
+
+def _price(number: str, unit: str) -> int:
+    return int(float(number.replace(',', '.')) * PRICE_UNITS[unit])
+
+
+def _price_range(match: re.Match) -> dict:
+    """Bounds of a "từ 500k đến 1 triệu" match; a lower bound without unit takes the upper bound's."""
+    upper = _price(match.group(3), match.group(4))
+    if match.group(2):
+        lower = _price(match.group(1), match.group(2))
+    else:
+        lower = _price(match.group(1), match.group(4))
+        if lower > upper:
+            # "từ 500 đến 1 triệu": the lower bound is in thousands
+            lower = _price(match.group(1), 'nghìn')
+    return {'$gte': lower, '$lte': upper}
+
+
+def extract_query_filters(query: str) -> dict:
+    """
+    Extract filters from a Vietnamese product query, e.g.
+    "điện thoại Samsung dưới 10 triệu" -> {"brand": "samsung", "price": {"$lte": 10000000}}.
+    """
+    text = query.lower()
+    filters = {}
+
+    between = PRICE_BETWEEN.search(text)
+    if between:
+        filters['price'] = _price_range(between)
+    else:
+        below = PRICE_BELOW.search(text)
+        # A lower bound never overlaps the upper bound's phrase
+        above = next((
+            match for match in PRICE_ABOVE.finditer(text)
+            if below is None or match.end() <= below.start() or match.start() >= below.end()
+        ), None)
+        price = {}
+        if below:
+            price['$lte'] = _price(below.group(1), below.group(2))
+        if above:
+            price['$gte'] = _price(above.group(1), above.group(2))
+        if price:
+            filters['price'] = price
+
+    brand = parse_brand(text)
+    if brand:
+        filters['brand'] = brand
+
+    ram = re.search(r'ram\s*(\d+)\s*gb|(\d+)\s*gb\s*ram', text)
+    if ram:
+        filters['ram_gb'] = {'$gte': float(ram.group(1) or ram.group(2))}
+
+    return filters
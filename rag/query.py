@@ -0,0 +1,46 @@
+import threading
+import numpy as np
+from typing import Callable, List, Optional
+
+
+class QueryContext():
+    """
+    A user query together with its embedding.
+
+    The embedding is computed at most once, on first access, and is then shared
+    by every stage that receives the context (semantic router, vector search,
+    ...), so a request pays for a single `encode` call.
+    """
+    def __init__(self, text: str, embed: Callable[[str], List[float]], model_name: Optional[str] = None):
+        """
+        Args:
+            text (str): The user query.
+            embed (Callable): Function returning the embedding of a text as a list.
+            model_name (str, optional): Name of the embedding model behind `embed`,
+                used by other stages to check they can reuse the vector.
+        """
+        self.text = text
+        self.model_name = model_name
+        self._embed = embed
+        self._embedding = None
+        self._vector = None
+        self._lock = threading.Lock()
+
+    @property
+    def embedding(self) -> List[float]:
+        """Query embedding as a list of floats."""
+        if self._embedding is None:
+            with self._lock:
+                if self._embedding is None:
+                    self._embedding = self._embed(self.text)
+        return self._embedding
+
+    @property
+    def vector(self) -> np.ndarray:
+        """Query embedding as a float32 numpy array."""
+        if self._vector is None:
+            self._vector = np.asarray(self.embedding, dtype=np.float32)
+        return self._vector
+
+    def __str__(self):
+        return self.text
@@ -1 +1,2 @@
-from re_rank.core import Reranker
\ No newline at end of file
+from re_rank.core import Reranker
+from re_rank.cascade import CascadePolicy
\ No newline at end of file
@@ -0,0 +1,63 @@
+import threading
+from typing import List
+
+
+class CascadePolicy():
+    """
+    Decide from first-stage similarity scores how much of a candidate list
+    needs the cross-encoder.
+
+    The thresholds are cosine similarities, the `score` of `RAG.vector_search`
+    and `RAG.hybrid_search` for every store (Chroma L2 distances are converted),
+    not fused RRF scores.
+
+    - If the top candidate is confident (score >= `min_top_score`) and ahead of
+      the runner-up by at least `skip_margin`, reranking is skipped.
+    - Otherwise only the ambiguous band, the candidates within `band` of the top
+      score (at least 2, at most `max_rerank`), is reranked; the rest keep their
+      first-stage order after it.
+    """
+    def __init__(self, skip_margin: float = 0.08, min_top_score: float = 0.5,
+                 band: float = 0.1, max_rerank: int = None):
+        self.skip_margin = skip_margin
+        self.min_top_score = min_top_score
+        self.band = band
+        self.max_rerank = max_rerank
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.skipped = 0
+        self.candidates = 0
+        self.reranked = 0
+
+    def plan(self, scores: List[float]) -> int:
+        """
+        Args:
+            scores (list): First-stage scores, sorted in decreasing order.
+
+        Returns:
+            int: Number of leading candidates to rerank (0 = skip reranking).
+        """
+        if len(scores) < 2:
+            n_rerank = 0
+        elif scores[0] >= self.min_top_score and scores[0] - scores[1] >= self.skip_margin:
+            n_rerank = 0
+        else:
+            n_rerank = max(sum(1 for score in scores if score >= scores[0] - self.band), 2)
+            if self.max_rerank:
+                n_rerank = min(n_rerank, self.max_rerank)
+
+        with self._lock:
+            self.requests += 1
+            self.skipped += n_rerank == 0
+            self.candidates += len(scores)
+            self.reranked += n_rerank
+        return n_rerank
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "skipped": self.skipped,
+                "skip_rate": self.skipped / self.requests if self.requests else 0.0,
+                "reranked_fraction": self.reranked / self.candidates if self.candidates else 0.0,
+            }
@@ -1,23 +1,94 @@
-
 from sentence_transformers import CrossEncoder
+import hashlib
 import numpy as np
+from typing import Literal, Optional, Tuple
+from embeddings.cache import normalize_text
+from rag.cache import LRUCache
 
 class Reranker():
-    def __init__(self, model_name: str = "Alibaba-NLP/gte-multilingual-reranker-base"):
-        self.reranker = CrossEncoder(model_name, trust_remote_code=True)
+    def __init__(self, model_name: str = "Alibaba-NLP/gte-multilingual-reranker-base",
+                 cache_size: int = 8192, cache_ttl: Optional[float] = None,
+                 backend: Literal['torch', 'onnx', 'onnx-int8'] = 'torch'):
+        """
+        Args:
+            model_name (str): CrossEncoder model.
+            cache_size (int): Max number of cached (query, document) scores, 0 disables the cache.
+            cache_ttl (float, optional): Seconds before a cached score expires.
+            backend (str): 'torch' (sentence_transformers CrossEncoder), 'onnx' or
+                'onnx-int8' (ONNX Runtime, exported on first use).
+        """
+        if backend == 'torch':
+            self.reranker = CrossEncoder(model_name, trust_remote_code=True)
+        elif backend in ('onnx', 'onnx-int8'):
+            from re_rank.onnx import ONNXCrossEncoder
+            self.reranker = ONNXCrossEncoder(model_name, quantize=backend == 'onnx-int8')
+        else:
+            raise ValueError(f"Unsupported reranker backend: {backend}")
+        self.score_cache = LRUCache(maxsize=cache_size, ttl=cache_ttl)
+
+    def cache_stats(self) -> dict:
+        """Hit/miss/eviction counters of the score cache."""
+        return self.score_cache.stats()
+
+    def score(self, query: str, passages: list[str], ids: Optional[list] = None) -> np.ndarray:
+        """
+        Cross-encoder scores of (query, passage) pairs.
+
+        Scores are cached by (normalized query, document id, content hash), so
+        only pairs missing from the cache are sent to `CrossEncoder.predict`.
+        """
+        query_key = normalize_text(query).lower()
+        keys = [
+            (query_key, ids[i] if ids is not None else None, hashlib.sha1(passage.encode('utf-8')).digest())
+            for i, passage in enumerate(passages)
+        ]
+        scores = np.empty(len(passages), dtype=np.float32)
+        missing = []
+        for i, key in enumerate(keys):
+            cached = self.score_cache.get(key)
+            if cached is None:
+                missing.append(i)
+            else:
+                scores[i] = cached
+
+        if missing:
+            predicted = self.reranker.predict([[query, passages[i]] for i in missing])
+            for i, value in zip(missing, predicted):
+                scores[i] = value
+                self.score_cache.put(keys[i], float(value))
+        return scores
+
+    def rank(self, query: str, passages: list[str], top_k: Optional[int] = None,
+             ids: Optional[list] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Score passages against the query and return their ranking.
+
+        Args:
+            query (str): The user query.
+            passages (list): Passages to rerank.
+            top_k (int, optional): Only rank the best `top_k` passages.
+            ids (list, optional): Document id of every passage, used as cache key.
+
+        Returns:
+            tuple: (order, scores) numpy arrays, `order` being indices into
+            `passages` sorted by decreasing score and `scores` their scores.
+        """
+        if len(passages) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        # Get scores from the reranker model (or its cache)
+        scores = self.score(query, passages, ids=ids)
+
+        if top_k is not None and top_k < len(scores):
+            # Select the top_k candidates first, then sort only those
+            candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            candidates = np.arange(len(scores))
+        order = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return order, scores[order]
 
     def __call__(self, query: str, passages: list[str]) -> tuple[list[float], list[str]]:
-        # Combine query and passages into pairs
-        query_passage_pairs = [[query, passage] for passage in passages]
-
-        # Get scores from the reranker model
-        scores = self.reranker.predict(query_passage_pairs)
-
-        # Sort passages based on scores
-        ranked_passages = [passage for _, passage in sorted(zip(scores, passages), key=lambda x: x[0], reverse=True)]
-        ranked_scores = sorted(scores, reverse=True)
-        
-        # Convert scores to standard Python floats
-        ranked_scores = [float(score) for score in ranked_scores]
-        # Return just the passages in ranked order
-        return ranked_scores, ranked_passages
\ No newline at end of file
+        order, scores = self.rank(query, passages)
+
+        # Return scores as standard Python floats and the passages in ranked order
+        return [float(score) for score in scores], [passages[i] for i in order]
@@ -0,0 +1,55 @@
+import os
+import numpy as np
+from typing import List, Literal, Optional
+from embeddings.onnxEmbedding import export_onnx_model, create_onnx_session
+
+
+class ONNXCrossEncoder():
+    """CrossEncoder exported to ONNX, with the same `predict` interface as sentence_transformers.CrossEncoder."""
+    def __init__(
+            self,
+            model_name: str = "Alibaba-NLP/gte-multilingual-reranker-base",
+            onnx_dir: str = './onnx_models',
+            quantize: bool = True,
+            activation: Literal['sigmoid', 'none'] = 'sigmoid',
+            max_length: int = 512,
+            batch_size: int = 32,
+            intra_op_threads: Optional[int] = None,
+        ):
+        """
+        Args:
+            model_name (str): HuggingFace model repository ID.
+            onnx_dir (str): Directory to store exported models.
+            quantize (bool): Use the dynamically int8-quantized model.
+            activation (str): 'sigmoid' matches CrossEncoder's default for single-label models.
+            max_length (int): Max tokens per (query, passage) pair.
+            batch_size (int): Number of pairs per inference call.
+            intra_op_threads (int, optional): ONNX Runtime intra-op threads, defaults to all cores.
+        """
+        from transformers import AutoTokenizer
+
+        self.activation = activation
+        self.max_length = max_length
+        self.batch_size = batch_size
+
+        model_path = export_onnx_model(model_name, onnx_dir=onnx_dir, task='sequence-classification', quantize=quantize)
+        self.session = create_onnx_session(model_path, intra_op_threads=intra_op_threads)
+        self.input_names = [inp.name for inp in self.session.get_inputs()]
+        self.tokenizer = AutoTokenizer.from_pretrained(os.path.dirname(model_path))
+
+    def predict(self, pairs: List[List[str]], **kwargs) -> np.ndarray:
+        scores = []
+        for start in range(0, len(pairs), self.batch_size):
+            batch = pairs[start:start + self.batch_size]
+            inputs = self.tokenizer(
+                [pair[0] for pair in batch], [pair[1] for pair in batch],
+                padding=True, truncation=True, max_length=self.max_length, return_tensors='np'
+            )
+            feeds = {name: inputs[name].astype(np.int64) for name in self.input_names}
+            logits = self.session.run(None, feeds)[0].reshape(len(batch), -1)[:, 0]
+            scores.append(logits)
+
+        scores = np.concatenate(scores) if scores else np.empty(0, dtype=np.float32)
+        if self.activation == 'sigmoid':
+            scores = 1 / (1 + np.exp(-scores))
+        return scores.astype(np.float32)
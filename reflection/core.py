@@ -1,25 +1,79 @@
+import hashlib
+from typing import Optional
+from rag.cache import LRUCache
+
+
 class Reflection():
-    def __init__(self, llm):
+    def __init__(self, llm, maxHistoryTokens: int = 1024, cacheSize: int = 1024, cacheTtl: Optional[float] = None):
+        """
+        Args:
+            llm: LLM used to rewrite the latest question into a standalone one.
+            maxHistoryTokens (int): Budget of the history sent to the LLM, most
+                recent messages are kept first.
+            cacheSize (int): Max number of memoized rewrites, 0 disables the cache.
+            cacheTtl (float, optional): Seconds before a memoized rewrite expires.
+        """
         self.llm = llm
+        self.maxHistoryTokens = maxHistoryTokens
+        self.cache = LRUCache(maxsize=cacheSize, ttl=cacheTtl)
+        self.skipped = 0
+
+    @staticmethod
+    def message_text(entry):
+        if entry.get('parts'):
+            return ' '.join(part['text'] for part in entry['parts'])
+        return entry.get('content') or ''
+
+    @staticmethod
+    def _count_tokens(text):
+        # Whitespace split: close to the syllable count of Vietnamese text and
+        # cheap enough for every request, no tokenizer is needed for online LLMs
+        return len(text.split())
 
     def _concat_and_format_texts(self, data):
         concatenatedTexts = []
         for entry in data:
             role = entry.get('role', '')
-            if entry.get('parts'):
-                all_texts = ' '.join(part['text'] for part in entry['parts'] )
-            elif entry.get('content'):
-                all_texts = entry['content'] 
-            concatenatedTexts.append(f"{role}: {all_texts} \n")
+            concatenatedTexts.append(f"{role}: {self.message_text(entry)} \n")
         return ''.join(concatenatedTexts)
 
+    def _trim_history(self, chatHistory, maxTokens):
+        """Most recent messages fitting in `maxTokens`; the last message is always kept."""
+        trimmed = []
+        total = 0
+        for entry in reversed(chatHistory):
+            total += self._count_tokens(self.message_text(entry))
+            if trimmed and total > maxTokens:
+                break
+            trimmed.append(entry)
+        return trimmed[::-1]
+
+    def cache_stats(self) -> dict:
+        """Counters of the rewrite cache and of the skipped LLM calls."""
+        return {**self.cache.stats(), "skipped": self.skipped}
 
-    def __call__(self, chatHistory, lastItemsConsidereds=100):
-        
-        if len(chatHistory) >= lastItemsConsidereds:
-            chatHistory = chatHistory[len(chatHistory) - lastItemsConsidereds:]
+    def __call__(self, chatHistory, maxTokens: Optional[int] = None):
+        """
+        Standalone version of the latest question in `chatHistory`.
+
+        A conversation with a single user message has nothing to de-reference and
+        is returned as is without calling the LLM; other rewrites are memoized by
+        a hash of the trimmed history.
+        """
+        if not chatHistory:
+            return ''
+
+        if sum(entry.get('role') == 'user' for entry in chatHistory) <= 1:
+            self.skipped += 1
+            return self.message_text(chatHistory[-1])
+
+        chatHistory = self._trim_history(chatHistory, maxTokens or self.maxHistoryTokens)
 
         historyString = self._concat_and_format_texts(chatHistory)
+        key = hashlib.sha1(historyString.encode('utf-8')).hexdigest()
+        completion = self.cache.get(key)
+        if completion is not None:
+            return completion
 
         higherLevelSummariesPrompt = {
             "role": "user",
@@ -30,6 +84,6 @@ class Reflection():
         print(higherLevelSummariesPrompt)
 
         completion = self.llm.generate_content([higherLevelSummariesPrompt])
+        self.cache.put(key, completion)
     
         return completion
-
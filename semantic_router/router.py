@@ -1,30 +1,142 @@
+import os
+import json
+import hashlib
 import numpy as np
+from typing import List, Literal, Optional, Tuple
+
+AGGREGATIONS = ('mean', 'max', 'topk', 'centroid')
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
 
 class SemanticRouter():
-    def __init__(self, embedding, routes):
+    def __init__(self, embedding, routes, aggregation: Literal['mean', 'max', 'topk', 'centroid'] = 'mean', top_k: int = 3,
+                 index_path: Optional[str] = None):
+        """
+        Args:
+            embedding: Embedding model used for samples and queries.
+            routes (list): Routes with their sample utterances.
+            aggregation (str): How sample similarities are turned into a route score:
+                'mean', 'max', 'topk' (mean of the `top_k` best samples) or
+                'centroid' (similarity to the route's mean sample embedding).
+            top_k (int): Number of samples averaged by the 'topk' aggregation.
+            index_path (str, optional): Directory where sample embeddings are persisted.
+                They are loaded with mmap on startup and only re-embedded when the
+                model name or the sample texts change.
+        """
+        if aggregation not in AGGREGATIONS:
+            raise ValueError(f"Unsupported aggregation: {aggregation}")
+
         self.routes = routes
         self.embedding = embedding
-        self.routesEmbedding = {}
+        self.aggregation = aggregation
+        self.top_k = top_k
+        self.routeNames = [route.name for route in self.routes]
+
+        counts = np.array([len(route.samples) for route in self.routes], dtype=np.int64)
+        sampleMatrix = self._load_index(index_path) if index_path else None
+        if sampleMatrix is None:
+            # Per-sample normalized matrix, samples of a route are contiguous rows
+            sampleMatrix = np.vstack([_normalize(self.embedding.encode(route.samples)) for route in self.routes])
+            if index_path:
+                self._save_index(index_path, sampleMatrix)
+        self._build_index(sampleMatrix, counts)
+
+    def fingerprint(self) -> str:
+        """Hash of the embedding model name and every route's sample texts."""
+        payload = json.dumps(
+            {'model': self.embedding.name, 'routes': [[route.name, list(route.samples)] for route in self.routes]},
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
 
-        for route in self.routes:
-            self.routesEmbedding[
-                route.name
-            ] = self.embedding.encode(route.samples)
+    def _load_index(self, index_path: str) -> Optional[np.ndarray]:
+        meta_path = os.path.join(index_path, 'meta.json')
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('fingerprint') != self.fingerprint():
+            print("Router samples or embedding model changed, re-embedding samples...")
+            return None
+        print(f"Loaded router index from {index_path}")
+        return np.load(os.path.join(index_path, 'samples.npy'), mmap_mode='r')
+
+    def _save_index(self, index_path: str, sampleMatrix: np.ndarray):
+        os.makedirs(index_path, exist_ok=True)
+        np.save(os.path.join(index_path, 'samples.npy'), np.asarray(sampleMatrix, dtype=np.float32))
+        # Write the fingerprint last, so a partial write is never loaded
+        with open(os.path.join(index_path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({'fingerprint': self.fingerprint(), 'routes': self.routeNames}, f)
+
+    def _build_index(self, sampleMatrix: np.ndarray, counts: np.ndarray):
+        """Index a (n_samples x dim) matrix whose rows are grouped by route."""
+        self.sampleMatrix = sampleMatrix
+        self.routeIds = np.repeat(np.arange(len(self.routes)), counts)
+        self.routeOffsets = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        self.routeCounts = counts
+
+        self.routesEmbedding = {
+            name: self.sampleMatrix[self.routeIds == i] for i, name in enumerate(self.routeNames)
+        }
+        self.centroids = _normalize(np.stack([e.mean(axis=0) for e in self.routesEmbedding.values()]))
+
+        # (n_routes x max_samples) gather index, padded with -1, for top-k aggregation
+        self._padded = np.full((len(self.routes), counts.max()), -1, dtype=np.int64)
+        for i, (offset, count) in enumerate(zip(self.routeOffsets, counts)):
+            self._padded[i, :count] = np.arange(offset, offset + count)
 
     def get_routes(self):
         return self.routes
 
-    def guide(self, query):
-        queryEmbedding = self.embedding.encode([query]) 
-        queryEmbedding = queryEmbedding / np.linalg.norm(queryEmbedding)
-        scores = []
+    def _encode_queries(self, queries) -> np.ndarray:
+        vectors = [None] * len(queries)
+        texts = []
+        for i, query in enumerate(queries):
+            # Reuse the embedding of a query context computed with the same model
+            if hasattr(query, 'vector') and getattr(query, 'model_name', None) == self.embedding.name:
+                vectors[i] = np.asarray(query.vector, dtype=np.float32)
+            else:
+                texts.append(i)
+        if texts:
+            for i, vector in zip(texts, np.asarray(self.embedding.encode([str(queries[i]) for i in texts]))):
+                vectors[i] = vector
+        return _normalize(np.stack(vectors))
+
+    def score(self, queryEmbeddings: np.ndarray) -> np.ndarray:
+        """Route scores (n_queries x n_routes) of normalized query embeddings."""
+        if self.aggregation == 'centroid':
+            return queryEmbeddings @ self.centroids.T
+
+        similarities = queryEmbeddings @ self.sampleMatrix.T
+        if self.aggregation == 'mean':
+            return np.add.reduceat(similarities, self.routeOffsets, axis=1) / self.routeCounts
+        if self.aggregation == 'max':
+            return np.maximum.reduceat(similarities, self.routeOffsets, axis=1)
 
-        # Calculate the cosine similarity of the query embedding with the sample embeddings of the router.
+        # Top-k mean over each route's padded block of samples
+        gathered = np.where(self._padded >= 0, similarities[:, self._padded], -np.inf)
+        k = np.minimum(self.top_k, self.routeCounts)
+        ranked = -np.sort(-gathered, axis=2)[:, :, :k.max()]
+        ranked = np.where(np.arange(k.max()) < k[:, None], ranked, 0.0)
+        return ranked.sum(axis=2) / k
 
-        for route in self.routes:
-            routesEmbedding = self.routesEmbedding[route.name] / np.linalg.norm(self.routesEmbedding[route.name])
-            score = np.mean(np.dot(routesEmbedding, queryEmbedding.T).flatten())
-            scores.append((score, route.name))
+    def guide_many(self, queries: list, batch_size: int = 256) -> List[Tuple[float, str]]:
+        """Route many queries (strings or query contexts) at once."""
+        guided = []
+        for start in range(0, len(queries), batch_size):
+            scores = self.score(self._encode_queries(queries[start:start + batch_size]))
+            best = scores.argmax(axis=1)
+            guided.extend(
+                (float(scores[i, route]), self.routeNames[route]) for i, route in enumerate(best)
+            )
+        return guided
 
-        scores.sort(reverse=True)
-        return scores[0]
\ No newline at end of file
+    def guide(self, query) -> Tuple[float, str]:
+        """Return (score, route name) of the best route for a query."""
+        return self.guide_many([query])[0]
@@ -1,20 +1,22 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from dotenv import load_dotenv
 import os
+import json
 import google.generativeai as genai
 from flask_cors import CORS
 from rag.core import RAG
-from embeddings import SentenceTransformerEmbedding, EmbeddingConfig
+from model_registry import get_embedding, get_reranker, get_llm
 from semantic_router import SemanticRouter, Route
 from semantic_router.samples import productsSample, chitchatSample
 import google.generativeai as genai
 import openai
 from reflection import Reflection
-from re_rank import Reranker
-from llms.llms import LLMs
 import argparse
 import warnings
-from insert_data import load_csv_to_chromadb
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from insert_data import load_csv_folder_to_chromadb
 
 # Load environment variables from .env file
 load_dotenv()
@@ -46,12 +48,14 @@ def main(args):
 
     # define products route name
     PRODUCT_ROUTE_NAME = 'products' 
+    RAG_SYSTEM_PROMPT = "Hãy trở thành chuyên gia tư vấn bán hàng cho một cửa hàng điện thoại."
     CHITCHAT_ROUTE_NAME = 'chitchat'
 
-    sentenceTransformerEmbedding = SentenceTransformerEmbedding(config=EmbeddingConfig(name=args.embedding_model))
+    # Same instance as the one used by RAG and ingestion, see model_registry
+    sentenceTransformerEmbedding = get_embedding(args.embedding_model, backend=args.embedding_backend, cache_dir=args.embedding_cache_dir)
     productRoute = Route(name=PRODUCT_ROUTE_NAME, samples=productsSample)
     chitchatRoute = Route(name=CHITCHAT_ROUTE_NAME, samples=chitchatSample)
-    semanticRouter = SemanticRouter(sentenceTransformerEmbedding, routes=[productRoute, chitchatRoute])
+    semanticRouter = SemanticRouter(sentenceTransformerEmbedding, routes=[productRoute, chitchatRoute], index_path=args.router_index_dir)
     
     # --- End Semantic Router Setup --- #
 
@@ -106,7 +110,10 @@ def main(args):
     else:
         raise ValueError(f"Unsupported model engine: {args.model_engine}")
 
-    llm = LLMs(type=args.mode, model_version=args.model_version, model_name=args.model_name, engine=args.model_engine, base_url=MODEL_BASE_URL, api_key=MODEL_API_KEY)
+    llm = get_llm(type=args.mode, model_version=args.model_version, model_name=args.model_name, engine=args.model_engine, base_url=MODEL_BASE_URL, api_key=MODEL_API_KEY,
+                  batching=args.llm_batching, max_batch_size=args.llm_max_batch_size)
+    # Checked once: chat templates without a system role keep the instruction inline
+    use_system_prompt = args.mode == "offline" and llm.supports_system_prompt()
 
     # --- End Set up LLMs --- #
 
@@ -134,6 +141,10 @@ def main(args):
             qdrant_api=QDRANT_API,
             qdrant_url=QDRANT_URL,
             embeddingName=args.embedding_model,
+            embeddingCacheDir=args.embedding_cache_dir,
+            embeddingBackend=args.embedding_backend,
+            queryCacheSize=args.query_cache_size,
+            queryCacheTtl=args.query_cache_ttl,
             llm=llm,
         )
 
@@ -152,6 +163,10 @@ def main(args):
             dbName=MONGODB_NAME,
             dbCollection=MONGODB_COLLECTION,
             embeddingName=args.embedding_model,
+            embeddingCacheDir=args.embedding_cache_dir,
+            embeddingBackend=args.embedding_backend,
+            queryCacheSize=args.query_cache_size,
+            queryCacheTtl=args.query_cache_ttl,
             llm=llm,
         )
     else:
@@ -193,24 +208,70 @@ def main(args):
                 print(f"The collection {args.embedding_model.split('/')[-1]} does not exist.\n")
                 print("Starting to create new collection. Please make sure you have a valid CSV file in data folder.\n")
                 print(f"Detected {len(csv_files)} csv files.\n")
-                for i in  range(len(csv_files)):              
-                    load_csv_to_chromadb(csv_path=csv_files[i], persist_dir="./chroma_db", model_name=args.embedding_model)
-                    print(f"Processed {i+1} files.\n")  
+                load_csv_folder_to_chromadb(
+                    csv_paths=csv_files,
+                    persist_dir="./chroma_db",
+                    model_name=args.embedding_model,
+                    model=sentenceTransformerEmbedding
+                )
                 print("The data insert process is complete.")
 
         rag = RAG(
-            type='chromadb',
+            type=args.db,
             embeddingName=args.embedding_model,
+            embeddingCacheDir=args.embedding_cache_dir,
+            embeddingBackend=args.embedding_backend,
+            queryCacheSize=args.query_cache_size,
+            queryCacheTtl=args.query_cache_ttl,
+            faissIndexType=args.faiss_index_type,
+            faissNprobe=args.faiss_nprobe,
             llm=llm
         )
     # Initialize ReRanker
-    reranker = Reranker(model_name=args.reranker)
+    reranker = get_reranker(args.reranker, backend=args.reranker_backend)
 
     def process_query(query):
         return query.lower()
 
-    @app.route('/api/search', methods=['POST'])
-    def handle_query():
+    def route_and_retrieve(queryContext):
+        """Route a query and, for product questions, retrieve candidate passages."""
+        guidedRoute = semanticRouter.guide(queryContext)[1]
+        if guidedRoute != PRODUCT_ROUTE_NAME:
+            return guidedRoute, None
+        if args.hybrid:
+            return guidedRoute, rag.hybrid_search(queryContext)
+        return guidedRoute, rag.vector_search(queryContext)
+
+    # Speculative routing + retrieval on the raw last message, run while reflection waits on the LLM
+    speculationPool = ThreadPoolExecutor(max_workers=args.speculative_workers) if args.speculative else None
+    speculationStats = {'hits': 0, 'misses': 0}
+    speculationLock = threading.Lock()
+
+    def speculative_route_and_retrieve(data):
+        rawContext = rag.build_query_context(reflection.message_text(data[-1]))
+        speculative = speculationPool.submit(route_and_retrieve, rawContext)
+
+        query = reflection(data)
+        if query == rawContext.text:
+            queryContext = rawContext
+            similarity = 1.0
+        else:
+            queryContext = rag.build_query_context(query)
+            a, b = queryContext.vector, rawContext.vector
+            similarity = float(a @ b / (np.linalg.norm(a) * np.linalg.norm(b) or 1.0))
+
+        hit = similarity >= args.speculative_threshold
+        with speculationLock:
+            speculationStats['hits' if hit else 'misses'] += 1
+        if hit:
+            guidedRoute, retrieved = speculative.result()
+        else:
+            speculative.cancel()
+            guidedRoute, retrieved = route_and_retrieve(queryContext)
+        return query, guidedRoute, retrieved
+
+    def prepare_generation(data):
+        """Reflect, route, retrieve and rerank; return the model to call and its messages."""
 
         print("\n🚀 Starting RAG Server with the following setup:")
         print("===============================================")
@@ -222,42 +283,90 @@ def main(args):
         print(f"📊 Reranker Model: {args.reranker}")
         print(f"🗃️ Vector DB: {args.db}")
 
-        
-        data = list(request.get_json())
-
-        reflected_query = reflection(data)
-        query = reflected_query
+        if args.speculative:
+            query, guidedRoute, retrieved = speculative_route_and_retrieve(data)
+        else:
+            reflected_query = reflection(data)
+            query = reflected_query
 
-        guidedRoute = semanticRouter.guide(query)[1]
+            # Embed the query once for routing and retrieval
+            queryContext = rag.build_query_context(query)
+            guidedRoute, retrieved = route_and_retrieve(queryContext)
 
         if guidedRoute == PRODUCT_ROUTE_NAME:
             # Guide to RAG system
             print("Guide to RAGs")
 
             # Take relevant documents from RAG system
-            passages = [passage['combined_information'] for passage in rag.vector_search(query)]
+            passages = [passage['combined_information'] for passage in retrieved]
             
             # Rerannk retrieved documents
-            scores, ranked_passages = reranker(query, passages)
+            order, scores = reranker.rank(query, passages, ids=[passage['_id'] for passage in retrieved])
+            ranked_passages = [passages[i] for i in order]
             source_information = ""
             for i in range(len(ranked_passages)):
                 source_information += f"{i+1} {ranked_passages[i]}\n"
 
-            combined_information = f"Hãy trở thành chuyên gia tư vấn bán hàng cho một cửa hàng điện thoại. Câu hỏi của khách hàng: {query}\nTrả lời câu hỏi dựa vào các thông tin sản phẩm dưới đây: {source_information}."
+            if use_system_prompt:
+                # Fixed instruction first, so local engines reuse its KV cache across requests
+                data = [{"role": "system", "content": RAG_SYSTEM_PROMPT}] + data
+                combined_information = f"Câu hỏi của khách hàng: {query}\nTrả lời câu hỏi dựa vào các thông tin sản phẩm dưới đây: {source_information}."
+            else:
+                combined_information = f"{RAG_SYSTEM_PROMPT} Câu hỏi của khách hàng: {query}\nTrả lời câu hỏi dựa vào các thông tin sản phẩm dưới đây: {source_information}."
             data.append({
                 "role": "user",
                 "content": combined_information
             })
-            response = rag.generate_content(data)
-        else:
-            # Guide to LLMs
-            print("Guide to LLMs")
-            response = llm.generate_content(data)
+            return rag, data
+
+        # Guide to LLMs
+        print("Guide to LLMs")
+        return llm, data
+
+    @app.route('/api/search', methods=['POST'])
+    def handle_query():
+        data = list(request.get_json())
+        generator, messages = prepare_generation(data)
+        response = generator.generate_content(messages)
         
         return jsonify({
             'content': response,
             'role': 'assistant'
             })
+
+    @app.route('/api/search/stream', methods=['POST'])
+    def handle_query_stream():
+        """Same as /api/search, but the answer is sent as server-sent events while it is generated."""
+        data = list(request.get_json())
+        generator, messages = prepare_generation(data)
+
+        def events():
+            try:
+                for chunk in generator.stream_content(messages):
+                    yield f"data: {json.dumps({'content': chunk, 'role': 'assistant'}, ensure_ascii=False)}\n\n"
+            except Exception as e:
+                # A failed generation must not look like a complete (truncated) answer
+                print(f"❌ Streaming failed: {e}")
+                yield f"event: error\ndata: {json.dumps({'error': str(e)}, ensure_ascii=False)}\n\n"
+                return
+            yield "data: [DONE]\n\n"
+
+        return Response(
+            stream_with_context(events()),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+
+    @app.route('/api/cache_stats')
+    def handle_cache_stats():
+        return jsonify({
+            'query_embedding': rag.cache_stats(),
+            'rerank': reranker.cache_stats(),
+            'reflection': reflection.cache_stats(),
+            'speculation': dict(speculationStats),
+            'llm_batching': llm.batching_stats()
+        })
+
     app.run(host='0.0.0.0', port=5002, debug=True)
 
 if __name__ == "__main__": 
@@ -267,11 +376,25 @@ if __name__ == "__main__":
     model_group.add_argument('-m','--mode', type=str, choices=['online', 'offline'], default='offline', help='Choose either online or offline mode system')
     model_group.add_argument('-n','--model_name', type=str, default='gemini', help='Define name of LLM model to use')
     model_group.add_argument('-e','--model_engine', type=str, default='huggingface', help='Define model engine of LLM model (Optional)')
+    model_group.add_argument('--llm_batching', action='store_true', help='Batch concurrent requests to the huggingface or onnx engine on a background scheduler')
+    model_group.add_argument('--llm_max_batch_size', type=int, default=8, help='Max requests per batch when --llm_batching is set')
     model_group.add_argument('-v','--model_version', type=str, required=True, help='Define model version of LLM model (Optional)')
 
     feature_group = parser.add_argument_group("Feature Option")
-    feature_group.add_argument('--db', type=str, choices=['qdrant', 'mongodb', 'chromadb'], default='chromadb', help='Choose type of vector store database')
+    feature_group.add_argument('--db', type=str, choices=['qdrant', 'mongodb', 'chromadb', 'faiss'], default='chromadb', help='Choose type of vector store database')
+    feature_group.add_argument('--faiss_index_type', type=str, choices=['flat', 'hnsw', 'ivf'], default='flat', help='Index used by the faiss vector store (flat is an exact numpy search)')
+    feature_group.add_argument('--faiss_nprobe', type=int, default=16, help='IVF cells visited per query with --faiss_index_type ivf (higher is slower but more accurate)')
+    feature_group.add_argument('--hybrid', action='store_true', help='Use hybrid BM25 + vector retrieval (chromadb and faiss only)')
     feature_group.add_argument('--embedding_model', type=str, default='Alibaba-NLP/gte-multilingual-base', help='Declare what embedding model to use for RAG')
+    feature_group.add_argument('--embedding_cache_dir', type=str, default=None, help='Directory of the persistent embedding cache (Optional)')
+    feature_group.add_argument('--query_cache_size', type=int, default=1024, help='Max number of cached query embeddings (0 disables the cache)')
+    feature_group.add_argument('--query_cache_ttl', type=float, default=None, help='Seconds before a cached query embedding expires (Optional)')
+    feature_group.add_argument('--embedding_backend', type=str, choices=['torch', 'onnx', 'onnx-int8'], default='torch', help='Runtime of the embedding model')
+    feature_group.add_argument('--reranker_backend', type=str, choices=['torch', 'onnx', 'onnx-int8'], default='torch', help='Runtime of the reranker model')
+    feature_group.add_argument('--router_index_dir', type=str, default='./router_index', help='Directory of the persisted semantic router sample embeddings')
+    feature_group.add_argument('--speculative', action='store_true', help='Route and retrieve on the raw last message while reflection runs')
+    feature_group.add_argument('--speculative_threshold', type=float, default=0.9, help='Min cosine similarity between the raw and reflected query to reuse speculative results')
+    feature_group.add_argument('--speculative_workers', type=int, default=4, help='Threads running speculative retrieval')
     feature_group.add_argument('--reranker', type=str, default='Alibaba-NLP/gte-multilingual-reranker-base', help='Declare name of CrossEncoder ReRanker')
 
     args = parser.parse_args()
@@ -5,29 +5,44 @@ Only for vector search functionality
 import os
 import argparse
 from rag.core import RAG
-from embeddings import SentenceTransformerEmbedding, EmbeddingConfig
-from insert_data import load_csv_to_chromadb
+from insert_data import load_csv_folder_to_chromadb
 import chromadb
-from re_rank import Reranker
+from re_rank import CascadePolicy
+from model_registry import get_reranker
+from rag.filters import extract_query_filters
 
 class SearchOnlyRAG:
     def __init__(self, embedding_model: str = 'Alibaba-NLP/gte-multilingual-base', 
-                 reranker_model: str = 'Alibaba-NLP/gte-multilingual-reranker-base'):
+                 reranker_model: str = 'Alibaba-NLP/gte-multilingual-reranker-base',
+                 embedding_cache_dir: str = None,
+                 query_cache_size: int = 1024,
+                 query_cache_ttl: float = None,
+                 vector_store: str = 'chromadb',
+                 embedding_backend: str = 'torch',
+                 reranker_backend: str = 'torch',
+                 cascade_policy: CascadePolicy = None):
         self.embedding_model = embedding_model
         self.reranker_model = reranker_model
+        self.embedding_cache_dir = embedding_cache_dir
         
         # Setup ChromaDB
         self.setup_chromadb()
         
         # Setup RAG (without LLM)
+        # 'faiss' builds an in-process index from the chromadb collection
         self.rag = RAG(
-            type='chromadb',
+            type=vector_store,
             embeddingName=self.embedding_model,
+            embeddingCacheDir=self.embedding_cache_dir,
+            embeddingBackend=embedding_backend,
+            queryCacheSize=query_cache_size,
+            queryCacheTtl=query_cache_ttl,
             llm=None  # No LLM needed for search only
         )
         
         # Setup Reranker
-        self.reranker = Reranker(model_name=self.reranker_model)
+        self.reranker = get_reranker(self.reranker_model, backend=reranker_backend)
+        self.cascade_policy = cascade_policy or CascadePolicy()
         
     def setup_chromadb(self):
         """Setup ChromaDB with data if collection doesn't exist"""
@@ -62,47 +77,101 @@ class SearchOnlyRAG:
                 print("Creating new collection from CSV data...")
                 print(f"Found {len(csv_files)} CSV files.")
                 
-                for i, csv_file in enumerate(csv_files):              
-                    load_csv_to_chromadb(csv_path=csv_file, persist_dir="./chroma_db", model_name=self.embedding_model)
-                    print(f"Processed {i+1}/{len(csv_files)} files.")
+                load_csv_folder_to_chromadb(
+                    csv_paths=csv_files,
+                    persist_dir="./chroma_db",
+                    model_name=self.embedding_model,
+                    cache_dir=self.embedding_cache_dir
+                )
                 print("✅ Data loading completed!")
         else:
             print(f"✅ Collection {collection_name} already exists!")
 
-    def search(self, query: str, limit: int = 4, use_rerank: bool = True):
-        """Perform vector search with optional reranking"""
+    def cache_stats(self) -> dict:
+        """Counters of the caches used on the search path"""
+        return {
+            "query_embedding": self.rag.cache_stats(),
+            "rerank": self.reranker.cache_stats(),
+            "cascade": self.cascade_policy.stats()
+        }
+
+    def search(self, query: str, limit: int = 4, use_rerank: bool = True,
+               use_hybrid: bool = False, rerank_pool: int = None,
+               filters: dict = None, auto_filters: bool = False, cascade: bool = False):
+        """Perform vector (or hybrid BM25 + vector) search with optional reranking
+
+        Args:
+            rerank_pool (int, optional): Number of candidates sent to the reranker,
+                defaults to limit*2. Hybrid retrieval has better first-stage recall,
+                so a smaller pool can be used with it.
+            filters (dict, optional): Metadata filter, see rag.filters.
+            auto_filters (bool): Extract brand / price / RAM filters from the query
+                ("Samsung dưới 10 triệu"); explicit `filters` take precedence.
+            cascade (bool): Let `cascade_policy` skip reranking when the top vector
+                hit is clearly ahead, or rerank only the ambiguous head of the list.
+        """
         print(f"🔍 Searching for: '{query}'")
         
-        # Vector search
-        results = self.rag.vector_search(query, limit=limit*2 if use_rerank else limit)
+        if auto_filters:
+            filters = {**extract_query_filters(query), **(filters or {})}
+
+        candidates = (rerank_pool or limit*2) if use_rerank else limit
+        if use_hybrid:
+            results = self.rag.hybrid_search(query, limit=candidates, filters=filters)
+        else:
+            results = self.rag.vector_search(query, limit=candidates, filters=filters)
         
         if not results:
             return {"error": "No results found"}
         
+        cascade_info = None
         if use_rerank:
-            # Extract passages for reranking
-            passages = [result['combined_information'] for result in results]
-            
-            # Rerank
-            scores, ranked_passages = self.reranker(query, passages)
-            
-            # Combine results with rerank scores
-            reranked_results = []
-            for i, passage in enumerate(ranked_passages[:limit]):
-                # Find original result for this passage
-                original_result = next(r for r in results if r['combined_information'] == passage)
-                reranked_results.append({
-                    **original_result,
-                    'rerank_score': scores[i],
-                    'rank': i + 1
-                })
-            results = reranked_results
+            head, tail = results, []
+            if cascade:
+                # The policy reads similarities in decreasing order, hybrid results come in fused order
+                by_score = sorted(range(len(results)), key=lambda i: results[i]['score'], reverse=True)
+                n_rerank = self.cascade_policy.plan([results[i]['score'] for i in by_score])
+                # The most similar candidates are reranked, the others keep the retrieval (e.g. RRF) order
+                selected = set(by_score[:n_rerank])
+                head = [result for i, result in enumerate(results) if i in selected]
+                tail = [result for i, result in enumerate(results) if i not in selected]
+                cascade_info = {
+                    "skipped": n_rerank == 0,
+                    "reranked": n_rerank,
+                    "candidates": len(results)
+                }
+
+            reranked = []
+            if head:
+                # Extract passages for reranking
+                passages = [result['combined_information'] for result in head]
+                
+                # Rerank
+                order, scores = self.reranker.rank(
+                    query, passages, top_k=min(limit, len(head)), ids=[result['_id'] for result in head]
+                )
+                
+                # Reorder the original results by index
+                reranked = [
+                    {**head[index], 'rerank_score': float(score)}
+                    for index, score in zip(order, scores)
+                ]
+
+            # Candidates outside the reranked head keep their retrieval order
+            results = [
+                {**result, 'rank': rank}
+                for rank, result in enumerate((reranked + tail)[:limit], start=1)
+            ]
         
-        return {
+        response = {
             "query": query,
+            "filters": filters,
             "results": results,
             "total_found": len(results)
         }
+        if cascade_info is not None:
+            response["cascade"] = cascade_info
+        return response
 
 def main():
     parser = argparse.ArgumentParser(description="RAG Search Only - No LLM needed")
@@ -110,9 +179,20 @@ def main():
                        help='Embedding model name')
     parser.add_argument('--reranker', type=str, default='Alibaba-NLP/gte-multilingual-reranker-base', 
                        help='Reranker model name')
+    parser.add_argument('--embedding_cache_dir', type=str, default=None,
+                       help='Directory of the persistent embedding cache')
+    parser.add_argument('--db', type=str, choices=['chromadb', 'faiss'], default='chromadb',
+                       help='Vector store used for search')
+    parser.add_argument('--embedding_backend', type=str, choices=['torch', 'onnx', 'onnx-int8'], default='torch',
+                       help='Runtime of the embedding model')
+    parser.add_argument('--reranker_backend', type=str, choices=['torch', 'onnx', 'onnx-int8'], default='torch',
+                       help='Runtime of the reranker model')
     parser.add_argument('--query', type=str, help='Search query')
     parser.add_argument('--limit', type=int, default=4, help='Number of results to return')
     parser.add_argument('--no-rerank', action='store_true', help='Disable reranking')
+    parser.add_argument('--hybrid', action='store_true', help='Use hybrid BM25 + vector retrieval')
+    parser.add_argument('--auto-filters', action='store_true', help='Extract brand/price/RAM filters from the query')
+    parser.add_argument('--cascade', action='store_true', help='Skip or shrink reranking when the top vector hit is confident')
     
     args = parser.parse_args()
     
@@ -125,7 +205,11 @@ def main():
     # Initialize search system
     search_rag = SearchOnlyRAG(
         embedding_model=args.embedding_model,
-        reranker_model=args.reranker
+        reranker_model=args.reranker,
+        embedding_cache_dir=args.embedding_cache_dir,
+        vector_store=args.db,
+        embedding_backend=args.embedding_backend,
+        reranker_backend=args.reranker_backend
     )
     
     if args.query:
@@ -133,7 +217,10 @@ def main():
         results = search_rag.search(
             query=args.query, 
             limit=args.limit, 
-            use_rerank=not args.no_rerank
+            use_rerank=not args.no_rerank,
+            use_hybrid=args.hybrid,
+            auto_filters=args.auto_filters,
+            cascade=args.cascade
         )
         
         print(f"\n📋 Results for: '{results['query']}'")
@@ -161,7 +248,10 @@ def main():
                     results = search_rag.search(
                         query=query, 
                         limit=args.limit, 
-                        use_rerank=not args.no_rerank
+                        use_rerank=not args.no_rerank,
+                        use_hybrid=args.hybrid,
+                        auto_filters=args.auto_filters,
+                        cascade=args.cascade
                     )
                     
                     print(f"\n📋 Results for: '{results['query']}'")
@@ -0,0 +1,31 @@
+import pytest
+from rag.bm25 import BM25Index, reciprocal_rank_fusion
+
+
+def test_rrf_scores_by_rank():
+    fused = dict(reciprocal_rank_fusion([['a', 'b'], ['b', 'c']], k=60))
+
+    assert fused['a'] == pytest.approx(1 / 61)
+    assert fused['b'] == pytest.approx(1 / 62 + 1 / 61)
+    assert fused['c'] == pytest.approx(1 / 62)
+
+
+def test_rrf_orders_ids_found_by_both_lists_first():
+    fused = reciprocal_rank_fusion([['a', 'b', 'c'], ['c', 'd', 'b']])
+
+    assert [_id for _id, _ in fused][:2] == ['c', 'b']
+    assert [score for _, score in fused] == sorted((score for _, score in fused), reverse=True)
+
+
+def test_rrf_empty_lists():
+    assert reciprocal_rank_fusion([[], []]) == []
+
+
+def test_bm25_matches_exact_tokens():
+    index = BM25Index()
+    index.add(['1', '2', '3'], ['Samsung Galaxy S24 Ultra 256GB', 'iPhone 15 Pro Max', 'Xiaomi 14 Ultra'])
+
+    hits = index.search('s24 ultra', limit=3)
+
+    assert hits[0][0] == '1'
+    assert '2' not in dict(hits)
@@ -0,0 +1,42 @@
+from re_rank.cascade import CascadePolicy
+
+
+def test_skips_confident_top_hit():
+    policy = CascadePolicy(skip_margin=0.08, min_top_score=0.5, band=0.1)
+
+    assert policy.plan([0.82, 0.7, 0.65]) == 0
+
+
+def test_reranks_band_when_top_hit_is_close():
+    policy = CascadePolicy(skip_margin=0.08, min_top_score=0.5, band=0.1)
+
+    assert policy.plan([0.8, 0.78, 0.72, 0.6, 0.5]) == 3
+
+
+def test_reranks_when_top_hit_is_not_confident():
+    policy = CascadePolicy(skip_margin=0.08, min_top_score=0.5, band=0.1)
+
+    # Far ahead of the runner-up, but below min_top_score
+    assert policy.plan([0.4, 0.2, 0.1]) == 2
+
+
+def test_band_is_capped_by_max_rerank():
+    policy = CascadePolicy(band=0.5, max_rerank=3)
+
+    assert policy.plan([0.6, 0.59, 0.58, 0.57, 0.56]) == 3
+
+
+def test_single_candidate_is_not_reranked():
+    assert CascadePolicy().plan([0.3]) == 0
+
+
+def test_stats():
+    policy = CascadePolicy(skip_margin=0.08, min_top_score=0.5, band=0.1)
+    policy.plan([0.9, 0.5])
+    policy.plan([0.6, 0.58, 0.2, 0.1])
+
+    stats = policy.stats()
+    assert stats['requests'] == 2
+    assert stats['skipped'] == 1
+    assert stats['skip_rate'] == 0.5
+    assert stats['reranked_fraction'] == 2 / 6
@@ -0,0 +1,62 @@
+import multiprocessing
+import zlib
+
+import numpy as np
+
+from embeddings.cache import EmbeddingCache
+
+
+def vector_of(text, dim=8):
+    return np.random.default_rng(zlib.crc32(text.encode())).random(dim, dtype=np.float32)
+
+
+def write_texts(cache_dir, prefix, count):
+    cache = EmbeddingCache(cache_dir, 'model')
+    for i in range(count):
+        text = f"{prefix}-{i}"
+        cache.put([cache.key(text)], vector_of(text)[None])
+
+
+def test_put_and_reload(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), 'model')
+    texts = ['iphone 15', 'galaxy s24', 'iphone 15']
+    cache.put([cache.key(text) for text in texts], np.stack([vector_of(text) for text in texts]))
+
+    reloaded = EmbeddingCache(str(tmp_path), 'model')
+
+    assert len(reloaded) == 2
+    hit, miss = reloaded.get([reloaded.key('galaxy s24'), reloaded.key('redmi')])
+    assert np.array_equal(hit, vector_of('galaxy s24'))
+    assert miss is None
+
+
+def test_concurrent_processes_never_share_rows(tmp_path):
+    context = multiprocessing.get_context('spawn')
+    workers = [
+        context.Process(target=write_texts, args=(str(tmp_path), prefix, 300))
+        for prefix in ('ingest', 'serve')
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+        assert worker.exitcode == 0
+
+    cache = EmbeddingCache(str(tmp_path), 'model')
+    texts = [f"{prefix}-{i}" for prefix in ('ingest', 'serve') for i in range(300)]
+
+    assert len(cache) == len(texts)
+    for text, vector in zip(texts, cache.get([cache.key(text) for text in texts])):
+        assert np.array_equal(vector, vector_of(text))
+
+
+def test_picks_up_rows_written_by_another_instance(tmp_path):
+    first = EmbeddingCache(str(tmp_path), 'model')
+    second = EmbeddingCache(str(tmp_path), 'model')
+    first.put([first.key('a')], vector_of('a')[None])
+    second.put([second.key('b')], vector_of('b')[None])
+    first.put([first.key('c')], vector_of('c')[None])
+
+    reloaded = EmbeddingCache(str(tmp_path), 'model')
+    for text in 'abc':
+        assert np.array_equal(reloaded.get([reloaded.key(text)])[0], vector_of(text))
@@ -0,0 +1,52 @@
+import os
+
+import numpy as np
+
+from rag.faiss_store import FaissVectorStore
+
+
+def batches(count, dim=8, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+    ids = [f"id-{seed}-{i}" for i in range(count)]
+    documents = [f"document {seed}-{i}" for i in range(count)]
+    return [(ids, documents, vectors.tolist(), [{'price': i} for i in range(count)])], vectors
+
+
+def test_build_search_and_reload(tmp_path):
+    data, vectors = batches(50)
+    store = FaissVectorStore(str(tmp_path / 'store')).build(data, source='v1')
+
+    hits = store.search([vectors[7].tolist()], limit=3)[0]
+    assert hits[0]['_id'] == 'id-0-7'
+    assert abs(hits[0]['score'] - 1.0) < 1e-5
+
+    reloaded = FaissVectorStore(str(tmp_path / 'store'))
+    assert reloaded.source_fingerprint() == 'v1'
+    assert len(reloaded.load()) == 50
+
+
+def test_rebuild_keeps_mapped_readers_valid(tmp_path):
+    path = str(tmp_path / 'store')
+    data, vectors = batches(50, seed=0)
+    reader = FaissVectorStore(path).build(data, source='v1')
+
+    new_data, new_vectors = batches(20, seed=1)
+    with FaissVectorStore(path).build_lock():
+        FaissVectorStore(path).build(new_data, source='v2')
+
+    # The old files were moved away, not truncated under the mapping
+    assert reader.search([vectors[3].tolist()], limit=1)[0][0]['_id'] == 'id-0-3'
+
+    current = FaissVectorStore(path).load()
+    assert current.source_fingerprint() == 'v2'
+    assert current.search([new_vectors[3].tolist()], limit=1)[0][0]['_id'] == 'id-1-3'
+    assert sorted(os.listdir(tmp_path)) == ['store', 'store.lock']
+
+
+def test_filtered_search(tmp_path):
+    data, vectors = batches(30)
+    store = FaissVectorStore(str(tmp_path / 'store')).build(data)
+
+    hits = store.search([vectors[0].tolist()], limit=5, filters={'price': {'$gte': 10}})[0]
+
+    assert hits and all(int(hit['_id'].split('-')[-1]) >= 10 for hit in hits)
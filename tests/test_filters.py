@@ -0,0 +1,40 @@
+import pytest
+from rag.filters import extract_query_filters, matches, to_chroma_where
+
+
+@pytest.mark.parametrize("query, price", [
+    ("samsung dưới 10 triệu", {'$lte': 10_000_000}),
+    ("iphone rẻ hơn 20 triệu", {'$lte': 20_000_000}),
+    ("tai nghe nhỏ hơn 500k", {'$lte': 500_000}),
+    ("điện thoại thấp hơn 5 tr", {'$lte': 5_000_000}),
+    ("điện thoại hơn 10 triệu", {'$gte': 10_000_000}),
+    ("laptop trên 15 triệu", {'$gte': 15_000_000}),
+    ("điện thoại lớn hơn 8 củ", {'$gte': 8_000_000}),
+    ("trên 5 triệu và dưới 10 triệu", {'$gte': 5_000_000, '$lte': 10_000_000}),
+    ("từ 5 đến 7 triệu", {'$gte': 5_000_000, '$lte': 7_000_000}),
+    ("khoảng 5,5 - 7 tr", {'$gte': 5_500_000, '$lte': 7_000_000}),
+    ("từ 500k đến 1 triệu", {'$gte': 500_000, '$lte': 1_000_000}),
+    ("từ 500 đến 1 triệu", {'$gte': 500_000, '$lte': 1_000_000}),
+    ("từ 800 nghìn tới 1,5 triệu", {'$gte': 800_000, '$lte': 1_500_000}),
+])
+def test_extract_price(query, price):
+    assert extract_query_filters(query)['price'] == price
+
+
+def test_extract_brand_and_ram():
+    filters = extract_query_filters("Điện thoại Samsung RAM 8GB dưới 10 triệu")
+
+    assert filters == {'brand': 'samsung', 'ram_gb': {'$gte': 8.0}, 'price': {'$lte': 10_000_000}}
+
+
+def test_extract_nothing():
+    assert extract_query_filters("điện thoại chụp ảnh đẹp") == {}
+
+
+def test_matches_and_chroma_where():
+    filters = {'brand': 'samsung', 'price': {'$lte': 10_000_000}}
+
+    assert matches({'brand': 'samsung', 'price': 9_000_000}, filters)
+    assert not matches({'brand': 'samsung', 'price': 11_000_000}, filters)
+    assert not matches({'brand': 'samsung'}, filters)
+    assert to_chroma_where(filters) == {'$and': [{'brand': {'$eq': 'samsung'}}, {'price': {'$lte': 10_000_000}}]}
@@ -0,0 +1,116 @@
+import queue
+import threading
+
+import numpy as np
+import pandas as pd
+
+from insert_data.build_chromadb import load_bm25_index
+from insert_data.pipeline import ChromaWriter, _put_until_stopped, parse_csv_file
+
+
+def write_csv(path, rows):
+    pd.DataFrame({
+        '_id': list(range(rows)),
+        'title': ['Samsung Galaxy A54'] * rows,
+        'product_promotion': [''] * rows,
+        'product_specs': [''] * rows,
+        'current_price': ['8.990.000 ₫'] * rows,
+        'color_options': ['[]'] * rows,
+    }).to_csv(path, index=False)
+
+
+def test_parse_csv_file_sends_chunks_then_done(tmp_path):
+    path = str(tmp_path / 'phones.csv')
+    write_csv(path, 25)
+    chunks = queue.Queue(maxsize=10)
+
+    rows = parse_csv_file(path, 10, chunks, threading.Event())
+
+    messages = [chunks.get_nowait() for _ in range(chunks.qsize())]
+    assert rows == 25
+    assert [kind for kind, _, _ in messages] == ['chunk', 'chunk', 'chunk', 'done']
+    assert [len(chunk) for _, _, chunk in messages[:3]] == [10, 10, 5]
+    assert messages[-1] == ('done', path, 25)
+
+
+def test_put_gives_up_once_stopped():
+    chunks = queue.Queue(maxsize=1)
+    chunks.put('full')
+    stop = threading.Event()
+    threading.Timer(0.1, stop.set).start()
+
+    assert _put_until_stopped(chunks, 'item', stop) is False
+
+
+def test_parse_csv_file_stops_on_a_full_queue(tmp_path):
+    path = str(tmp_path / 'phones.csv')
+    write_csv(path, 30)
+    chunks = queue.Queue(maxsize=1)
+    stop = threading.Event()
+    threading.Timer(0.2, stop.set).start()
+
+    # Nobody consumes the queue: the worker returns instead of hanging
+    assert parse_csv_file(path, 10, chunks, stop) == 10
+
+
+class FakeCollection:
+    def __init__(self, fail=False):
+        self.ids = []
+        self.fail = fail
+
+    def add(self, ids, documents, embeddings, metadatas):
+        if self.fail:
+            raise RuntimeError('disk full')
+        self.ids.extend(ids)
+
+
+def test_chroma_writer_writes_batches():
+    collection = FakeCollection()
+    writer = ChromaWriter(collection, write_batch_size=2, upsert=False)
+    writer.start()
+    writer.put(['1', '2', '3'], ['a', 'b', 'c'], np.zeros((3, 4), dtype=np.float32), [{}] * 3)
+    writer.close()
+
+    assert collection.ids == ['1', '2', '3']
+
+
+def test_chroma_writer_error_can_be_kept_quiet():
+    writer = ChromaWriter(FakeCollection(fail=True), write_batch_size=2, upsert=False)
+    writer.start()
+    writer.put(['1'], ['a'], np.zeros((1, 4), dtype=np.float32), [{}])
+
+    # While already unwinding another exception, closing must not replace it
+    writer.close(raise_error=False)
+    assert isinstance(writer.error, RuntimeError)
+
+
+class StoredCollection:
+    name = 'phones'
+
+    def __init__(self, documents):
+        self.documents = documents
+
+    def count(self):
+        return len(self.documents)
+
+    def get(self, include, limit, offset):
+        ids = list(self.documents)[offset:offset + limit]
+        return {'ids': ids, 'documents': [self.documents[_id] for _id in ids]}
+
+
+def test_missing_bm25_index_is_rebuilt_from_the_collection(tmp_path):
+    collection = StoredCollection({str(i): f"Samsung Galaxy A{i}" for i in range(7)})
+
+    bm25 = load_bm25_index(collection, str(tmp_path / 'bm25.pkl'), page_size=3)
+
+    assert len(bm25) == 7
+    assert bm25.search('a5', limit=1)[0][0] == '5'
+
+
+def test_saved_bm25_index_is_loaded(tmp_path):
+    path = str(tmp_path / 'bm25.pkl')
+    load_bm25_index(StoredCollection({'1': 'iPhone 15'}), path, page_size=10).save(path)
+
+    bm25 = load_bm25_index(StoredCollection({}), path, page_size=10)
+
+    assert '1' in bm25
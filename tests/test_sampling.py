@@ -0,0 +1,50 @@
+import numpy as np
+from llms.sampling import sample_next_tokens
+
+
+def test_greedy_takes_argmax_per_row():
+    logits = np.array([[0.1, 2.0, 0.3], [5.0, 1.0, 0.0]])
+
+    assert sample_next_tokens(logits).tolist() == [1, 0]
+    # Sampling at temperature 0 is greedy too
+    assert sample_next_tokens(logits, temperature=0, do_sample=True).tolist() == [1, 0]
+
+
+def test_top_k_keeps_only_k_tokens():
+    rng = np.random.default_rng(0)
+    logits = np.tile(np.array([[3.0, 2.9, 2.8, 0.0, -1.0]]), (2000, 1))
+
+    tokens = sample_next_tokens(logits, do_sample=True, top_k=2, rng=rng)
+
+    assert set(tokens.tolist()) == {0, 1}
+
+
+def test_top_p_keeps_the_nucleus():
+    rng = np.random.default_rng(0)
+    probs = np.array([0.5, 0.3, 0.15, 0.05])
+    logits = np.tile(np.log(probs), (4000, 1))
+
+    tokens = sample_next_tokens(logits, do_sample=True, top_p=0.7, rng=rng)
+
+    # 0.5 + 0.3 reaches top_p, the tail is never drawn
+    assert set(tokens.tolist()) == {0, 1}
+    assert abs((tokens == 0).mean() - 0.5 / 0.8) < 0.03
+
+
+def test_sampling_follows_the_distribution():
+    rng = np.random.default_rng(1)
+    probs = np.array([0.6, 0.3, 0.1])
+    logits = np.tile(np.log(probs), (20000, 1))
+
+    tokens = sample_next_tokens(logits, do_sample=True, rng=rng)
+
+    assert np.allclose(np.bincount(tokens, minlength=3) / len(tokens), probs, atol=0.015)
+
+
+def test_seeded_generators_are_reproducible():
+    logits = np.random.default_rng(2).normal(size=(8, 50))
+
+    first = sample_next_tokens(logits, do_sample=True, temperature=0.7, rng=np.random.default_rng(3))
+    second = sample_next_tokens(logits, do_sample=True, temperature=0.7, rng=np.random.default_rng(3))
+
+    assert first.tolist() == second.tolist()
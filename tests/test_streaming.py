@@ -0,0 +1,51 @@
+import json
+from llms.streaming import ThinkBlockFilter, filter_think_blocks, iter_ndjson, iter_sse_events
+
+
+def test_drops_think_block():
+    assert ''.join(filter_think_blocks(['<think>plan</think>\n\nXin chào'])) == 'Xin chào'
+
+
+def test_tags_split_across_chunks():
+    chunks = ['<thi', 'nk>hidden', ' text</th', 'ink>  Giá ', 'là 10 triệu']
+
+    assert ''.join(filter_think_blocks(chunks)) == 'Giá là 10 triệu'
+
+
+def test_partial_tag_is_held_back():
+    think_filter = ThinkBlockFilter()
+
+    assert think_filter.feed('Trả lời <') == 'Trả lời '
+    assert think_filter.feed('b>') == '<b>'
+    assert think_filter.flush() == ''
+
+
+def test_text_without_think_block_is_kept():
+    assert ''.join(filter_think_blocks(['a < b', ' and c'])) == 'a < b and c'
+
+
+def test_unclosed_think_block_is_dropped():
+    think_filter = ThinkBlockFilter()
+
+    assert think_filter.feed('Hello <think>never closed') == 'Hello '
+    assert think_filter.flush() == ''
+
+
+class FakeResponse:
+    def __init__(self, lines):
+        self.lines = lines
+
+    def iter_lines(self):
+        return iter(self.lines)
+
+
+def test_iter_sse_events_stops_at_done():
+    lines = [b'data: ' + json.dumps({'n': 1}).encode(), b'', b': keep-alive', b'data: [DONE]', b'data: {"n": 2}']
+
+    assert list(iter_sse_events(FakeResponse(lines))) == [{'n': 1}]
+
+
+def test_iter_ndjson_decodes_utf8():
+    lines = [json.dumps({'content': 'điện thoại'}, ensure_ascii=False).encode('utf-8'), b'']
+
+    assert list(iter_ndjson(FakeResponse(lines))) == [{'content': 'điện thoại'}]
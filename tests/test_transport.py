@@ -0,0 +1,141 @@
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+requests = pytest.importorskip("requests")
+
+from llms.transport import HTTPTransport
+
+
+class StubServer:
+    """Localhost HTTP/1.1 server answering from a queue of (status, headers) replies."""
+
+    def __init__(self, replies=None, drop_posts=False):
+        self.replies = list(replies or [])
+        self.drop_posts = drop_posts
+        self.requests = 0
+        self.connections = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                stub.connections += 1
+
+            def _reply(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                self.rfile.read(length)
+                stub.requests += 1
+                status, headers = stub.replies.pop(0) if stub.replies else (200, {})
+                body = b'{"ok": true}'
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self._reply()
+
+            def do_POST(self):
+                if stub.drop_posts:
+                    self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                    stub.requests += 1
+                    # The request reached the server, the connection drops before the answer
+                    self.close_connection = True
+                    return
+                self._reply()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def test_retry_after_is_honoured():
+    transport = HTTPTransport(backoff_base=0.001)
+    with StubServer([(429, {"Retry-After": "0.3"})]) as server:
+        t0 = time.monotonic()
+        response = transport.get(server.url)
+
+    assert response.status_code == 200
+    assert time.monotonic() - t0 >= 0.3
+    assert server.requests == 2
+    assert transport.retries == 1
+
+
+def test_server_errors_are_retried_with_backoff():
+    transport = HTTPTransport(max_retries=3, backoff_base=0.01)
+    with StubServer([(503, {}), (502, {}), (500, {})]) as server:
+        response = transport.get(server.url)
+
+    assert response.status_code == 200
+    assert server.requests == 4
+    assert transport.retries == 3
+
+
+def test_post_is_retried_only_when_not_processed():
+    transport = HTTPTransport(max_retries=3, backoff_base=0.01)
+    with StubServer([(503, {}), (429, {}), (500, {})]) as server:
+        response = transport.post(server.url, json={"prompt": "hi"})
+
+    assert response.status_code == 500
+    assert server.requests == 3
+    assert transport.retries == 2
+
+
+def test_last_error_response_is_returned_when_retries_run_out():
+    transport = HTTPTransport(max_retries=1, backoff_base=0.01)
+    with StubServer([(503, {}), (503, {}), (503, {})]) as server:
+        response = transport.get(server.url)
+
+    assert response.status_code == 503
+    assert server.requests == 2
+
+
+def test_keep_alive_connection_is_reused():
+    transport = HTTPTransport(backoff_base=0.01)
+    with StubServer([(503, {})]) as server:
+        for _ in range(5):
+            assert transport.get(server.url).json() == {"ok": True}
+
+    assert server.requests == 6
+    assert server.connections == 1
+
+
+def test_post_dropped_after_sending_is_not_retried():
+    transport = HTTPTransport(max_retries=3, backoff_base=0.01)
+    with StubServer(drop_posts=True) as server:
+        with pytest.raises(requests.exceptions.ConnectionError):
+            transport.post(server.url, json={"prompt": "hi"})
+
+    assert server.requests == 1
+    assert transport.retries == 0
+
+
+def test_refused_connection_is_retried():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    transport = HTTPTransport(max_retries=2, backoff_base=0.01)
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        transport.post(f"http://127.0.0.1:{port}", json={"prompt": "hi"})
+
+    assert transport.retries == 2
@@ -48,6 +48,11 @@ def api_search():
         query = data.get('query', '').strip()
         limit = data.get('limit', 5)
         use_rerank = data.get('use_rerank', True)
+        use_hybrid = data.get('use_hybrid', False)
+        rerank_pool = data.get('rerank_pool')
+        filters = data.get('filters')
+        auto_filters = data.get('auto_filters', False)
+        cascade = data.get('cascade', False)
         
         if not query:
             return jsonify({'error': 'Query cannot be empty'}), 400
@@ -57,7 +62,9 @@ def api_search():
         
         # Record search time
         start_time = time.time()
-        results = search_rag.search(query=query, limit=limit, use_rerank=use_rerank)
+        results = search_rag.search(query=query, limit=limit, use_rerank=use_rerank,
+                                    use_hybrid=use_hybrid, rerank_pool=rerank_pool,
+                                    filters=filters, auto_filters=auto_filters, cascade=cascade)
         search_time = time.time() - start_time
         
         # Add search time to results
@@ -89,6 +96,13 @@ def api_status():
         'message': 'Search system is ready' if search_rag else 'Search system not initialized'
     })
 
+@app.route('/api/cache_stats')
+def api_cache_stats():
+    """Hit/miss/eviction counters of the search caches"""
+    if search_rag is None:
+        return jsonify({'error': 'Search system not initialized'}), 500
+    return jsonify(search_rag.cache_stats())
+
 @app.route('/api/sample_queries')
 def api_sample_queries():
     """Get sample queries for testing"""